@@ -0,0 +1,101 @@
+# generate_data.py - isi database benchmark dengan data sintetis (deterministik per seed)
+# Contoh: python bench/generate_data.py --db bench/bench.db --reminders 100000 --messages 1000000
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import whatsapp_reminder_app as app_module  # noqa: E402
+
+JENIS = ["Mobil barang", "Pick up", "Truk", "Bus", "Mobil penumpang umum"]
+PREFIX = ["AD", "AB", "H", "K", "B"]
+NAMES = ["Budi", "Sari", "Agus", "Dewi", "Rudi", "Wati", "Joko", "Rina", "Eko", "Reni"]
+BATCH = 10000
+
+
+def use_db(path):
+    """Arahkan app ke database benchmark (tidak menyentuh reminders.db)."""
+    app_module.close_db_connection()
+    app_module.DB_PATH = path
+    app_module.init_db()
+
+
+def generate(path, n_reminders, n_messages, seed=42, days_back=60, days_ahead=365, message_days=400):
+    rnd = random.Random(seed)
+    app_module.close_db_connection()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    use_db(path)
+    con = app_module.get_db_connection()
+    today = date.today()
+    now = datetime.utcnow()
+
+    t0 = time.perf_counter()
+    rows = []
+    for i in range(n_reminders):
+        test_date = today + timedelta(days=rnd.randint(-days_back, days_ahead))
+        rows.append((
+            f"{rnd.choice(NAMES)} {i}",
+            f"{rnd.choice(PREFIX)} {rnd.randint(1, 9999)} {chr(65 + rnd.randint(0, 25))}{chr(65 + rnd.randint(0, 25))}",
+            f"SKA{i:07d}",
+            rnd.choice(JENIS),
+            test_date.isoformat(),
+            f"628{rnd.randint(100000000, 999999999)}",
+            (now - timedelta(days=rnd.randint(0, 365))).isoformat(),
+        ))
+        if len(rows) >= BATCH:
+            _insert_reminders(con, rows)
+    _insert_reminders(con, rows)
+    t_rem = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    rows = []
+    for i in range(n_messages):
+        created = now - timedelta(seconds=rnd.randint(0, message_days * 86400))
+        direction = "out" if rnd.random() < 0.9 else "in"
+        status = ("sent" if rnd.random() < 0.95 else "failed") if direction == "out" else "received"
+        rows.append((direction, f"628{rnd.randint(100000000, 999999999)}", "bench message", status, "", created.isoformat()))
+        if len(rows) >= BATCH:
+            _insert_messages(con, rows)
+    _insert_messages(con, rows)
+    app_module.backfill_message_rollups(con)
+    t_msg = time.perf_counter() - t0
+    return {"reminders": n_reminders, "messages": n_messages, "reminders_sec": round(t_rem, 2), "messages_sec": round(t_msg, 2)}
+
+
+def _insert_reminders(con, rows):
+    with con:
+        con.executemany(
+            "INSERT INTO reminders (name, vehicle_number, no_uji, jenis_kendaraan, test_date, phone, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    rows.clear()
+
+
+def _insert_messages(con, rows):
+    with con:
+        con.executemany(
+            "INSERT INTO messages (direction, phone, message, status, meta, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    rows.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate data sintetis untuk benchmark")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.db"))
+    parser.add_argument("--reminders", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if os.path.abspath(args.db) == os.path.abspath(app_module.DB_PATH):
+        parser.error("jangan pakai reminders.db untuk benchmark")
+    print(generate(args.db, args.reminders, args.messages, args.seed))
+
+
+if __name__ == "__main__":
+    main()
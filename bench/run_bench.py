@@ -0,0 +1,210 @@
+# run_bench.py - skenario benchmark backend, hasil ditulis sebagai JSON
+# Contoh:
+#   python bench/run_bench.py --reminders 100000 --messages 1000000 --out bench/results.json
+#   python bench/run_bench.py --db bench/bench.db --skip-generate --latency-ms 80 --error-rate 0.01
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+import whatsapp_reminder_app as app_module  # noqa: E402
+from generate_data import generate, use_db  # noqa: E402
+from stub_gateway import StubGateway  # noqa: E402
+
+
+def summarize(samples_ms):
+    ordered = sorted(samples_ms)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+@contextlib.contextmanager
+def response_cache(enabled):
+    """Nyalakan/matikan response cache app selama skenario, cache dikosongkan di awal."""
+    saved = app_module.RESPONSE_CACHE_ENABLED
+    app_module.RESPONSE_CACHE_ENABLED = enabled
+    app_module.response_cache.clear()
+    try:
+        yield
+    finally:
+        app_module.RESPONSE_CACHE_ENABLED = saved
+
+
+def time_request(client, url, iterations, cached=False):
+    """
+    Default tanpa response cache: URL yang sama diminta berulang, jadi dengan cache semua sampel
+    setelah yang pertama hanya mengukur cache hit. cached=True mengukur cache hit (setelah satu request pemanasan).
+    """
+    samples = []
+    with response_cache(cached):
+        if cached:
+            client.get(url).get_data()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            resp = client.get(url)
+            resp.get_data()
+            samples.append((time.perf_counter() - t0) * 1000)
+            if resp.status_code != 200:
+                raise RuntimeError(f"{url} -> HTTP {resp.status_code}")
+    result = summarize(samples)
+    result["bytes"] = len(resp.get_data())
+    return result
+
+
+def bench_run_now(repeats):
+    """Throughput run_now_check; outbox dikosongkan tiap ulangan supaya reminder yang sama dikirim lagi."""
+    runs = []
+    for _ in range(repeats):
+        with app_module.get_db_connection() as con:
+            con.execute("DELETE FROM outbox")
+        t0 = time.perf_counter()
+        actions = app_module.run_now_check()
+        elapsed = time.perf_counter() - t0
+        if app_module._message_writer is not None:
+            app_module._message_writer.flush()
+        sent = sum(1 for a in actions if str(a['send_result'].get('status', '')).startswith('sent'))
+        runs.append({"due": len(actions), "sent": sent, "seconds": round(elapsed, 3),
+                     "msgs_per_sec": round(len(actions) / elapsed, 1) if elapsed else None})
+    return {"runs": runs, "best_msgs_per_sec": max((r["msgs_per_sec"] or 0) for r in runs)}
+
+
+def bench_add_reminder(n):
+    t0 = time.perf_counter()
+    for i in range(n):
+        app_module.add_reminder(f"Bench {i}", None, f"AD {i} BN", "2030-01-01",
+                                {"phone": "081234567890", "no_uji": f"BENCH{i:06d}", "jenis_kendaraan": "Truk"})
+    elapsed = time.perf_counter() - t0
+    with app_module.get_db_connection() as con:
+        con.execute("DELETE FROM reminders WHERE no_uji LIKE 'BENCH%'")
+    return {"n": n, "seconds": round(elapsed, 3), "inserts_per_sec": round(n / elapsed, 1)}
+
+
+def run_scenarios(client, args):
+    return {
+        "run_now_check": bench_run_now(args.run_repeats),
+        "list_full": time_request(client, "/list?format=json", max(1, args.iterations // 10)),
+        "list_page": time_request(client, "/list?format=json&page=1&per_page=25", args.iterations),
+        "list_summary": time_request(client, "/list/summary", args.iterations),
+        "api_stats": time_request(client, "/api/stats", args.iterations),
+        "timeseries_day": time_request(client, "/api/messages_timeseries?period=day&days=30", args.iterations),
+        "timeseries_month": time_request(client, "/api/messages_timeseries?period=month&months=12", args.iterations),
+        "list_page_cached": time_request(client, "/list?format=json&page=1&per_page=25", args.iterations, cached=True),
+        "api_stats_cached": time_request(client, "/api/stats", args.iterations, cached=True),
+        "add_reminder": bench_add_reminder(args.inserts),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend WhatsApp reminder")
+    parser.add_argument("--db", default=os.path.join(BENCH_DIR, "bench.db"))
+    parser.add_argument("--skip-generate", action="store_true", help="pakai --db yang sudah ada")
+    parser.add_argument("--reminders", type=int, default=100000)
+    parser.add_argument("--messages", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--gateway-url", help="pakai gateway yang sudah jalan (default: stub in-process)")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=10)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=None, help="override GATEWAY_BATCH_SIZE (0 = /send satu-satu)")
+    parser.add_argument("--iterations", type=int, default=50, help="jumlah request per endpoint")
+    parser.add_argument("--run-repeats", type=int, default=2)
+    parser.add_argument("--inserts", type=int, default=1000)
+    parser.add_argument("--out", default=os.path.join(BENCH_DIR, "results.json"), help="file JSON hasil, '-' untuk stdout")
+    parser.add_argument("--verbose", action="store_true", help="tampilkan output print dari app selama skenario")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db) == os.path.abspath(os.path.join(ROOT_DIR, "reminders.db")):
+        parser.error("jangan pakai reminders.db untuk benchmark")
+
+    gateway = None
+    if args.gateway_url:
+        base_url = args.gateway_url.rstrip("/")
+    else:
+        gateway = StubGateway(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                              error_rate=args.error_rate, seed=args.seed).start()
+        base_url = gateway.url
+    app_module.NODE_API = base_url + "/send"
+    app_module.NODE_BATCH_API = base_url + "/send-batch"
+    app_module.gateway_breaker.status_url = base_url + "/status"
+    if args.batch_size is not None:
+        app_module.GATEWAY_BATCH_SIZE = args.batch_size
+
+    setup = None
+    if args.skip_generate:
+        use_db(args.db)
+    else:
+        setup = generate(args.db, args.reminders, args.messages, args.seed)
+    if app_module.MESSAGE_LOG_BUFFERED:
+        app_module.start_message_writer()
+
+    client = app_module.app.test_client()
+    with open(os.devnull, "w") as devnull:
+        quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(devnull)
+        with quiet:
+            results = run_scenarios(client, args)
+    app_module.stop_message_writer()
+    if gateway:
+        results["gateway"] = dict(gateway.counts)
+        gateway.stop()
+
+    with app_module.get_db_connection() as con:
+        counts = {t: con.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("reminders", "messages")}
+    report = {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "db": os.path.abspath(args.db),
+            "db_size_bytes": os.path.getsize(args.db),
+            "rows": counts,
+            "setup": setup,
+            "params": {k: v for k, v in vars(args).items() if k != "out"},
+            "config": {
+                "SEND_CONCURRENCY": app_module.SEND_CONCURRENCY,
+                "SEND_RATE_PER_SEC": app_module.SEND_RATE_PER_SEC,
+                "GATEWAY_BATCH_SIZE": app_module.GATEWAY_BATCH_SIZE,
+                "RUN_MODE": app_module.RUN_MODE,
+                "REMINDER_STAGES": app_module.REMINDER_STAGES,
+                "RESPONSE_CACHE_ENABLED": app_module.RESPONSE_CACHE_ENABLED,
+            },
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out == "-":
+        print(text)
+    else:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"📊 Hasil benchmark ditulis ke {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# stub_gateway.py - pengganti lokal endpoint /send milik wa-bot untuk benchmark
+# Contoh: python bench/stub_gateway.py --port 3999 --latency-ms 80 --error-rate 0.02
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubGateway:
+    """HTTP server kecil yang meniru wa-bot: POST /send & /send-batch dengan latency & error rate yang bisa diatur, GET /status."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=50, jitter_ms=0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {"ok": 0, "error": 0}
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, sama seperti express
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body):
+                raw = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_GET(self):
+                if self.path != "/status":
+                    return self._reply(404, {"error": "not found"})
+                return self._reply(200, {"connected": True})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._reply(400, {"error": "invalid json"})
+                if self.path == "/send-batch":
+                    return self._send_batch(body)
+                if self.path != "/send":
+                    return self._reply(404, {"error": "not found"})
+                if not body.get("phone") or not body.get("message"):
+                    return self._reply(400, {"error": "Field 'phone' dan 'message' wajib diisi"})
+                with gateway.lock:
+                    delay = gateway.latency_ms + gateway.random.uniform(0, gateway.jitter_ms)
+                    fail = gateway.random.random() < gateway.error_rate
+                time.sleep(delay / 1000)
+                with gateway.lock:
+                    gateway.counts["error" if fail else "ok"] += 1
+                if fail:
+                    return self._reply(503, {"error": "WhatsApp belum terkoneksi. Scan QR dulu."})
+                return self._reply(200, {"success": True, "to": f"{body['phone']}@s.whatsapp.net", "message": body["message"]})
+
+            def _send_batch(self, body):
+                items = body.get("items") if isinstance(body, dict) else body
+                if not isinstance(items, list) or not items:
+                    return self._reply(400, {"error": "Body harus array {phone, message, client_id} atau {items: [...]}"})
+                # satu round trip: latency dihitung sekali per request, error rate per item
+                with gateway.lock:
+                    delay = gateway.latency_ms + gateway.random.uniform(0, gateway.jitter_ms)
+                    fails = [gateway.random.random() < gateway.error_rate for _ in items]
+                time.sleep(delay / 1000)
+                results = []
+                for i, (item, fail) in enumerate(zip(items, fails)):
+                    client_id = item.get("client_id", str(i))
+                    if fail:
+                        results.append({"client_id": client_id, "success": False, "status": 503,
+                                        "error": "WhatsApp belum terkoneksi. Scan QR dulu."})
+                    else:
+                        results.append({"client_id": client_id, "success": True, "to": f"{item.get('phone')}@s.whatsapp.net"})
+                with gateway.lock:
+                    gateway.counts["error"] += sum(fails)
+                    gateway.counts["ok"] += len(fails) - sum(fails)
+                sent = len(fails) - sum(fails)
+                return self._reply(200, {"success": sent == len(items), "sent": sent, "failed": sum(fails), "results": results})
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-gateway", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub WhatsApp gateway untuk benchmark")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    gw = StubGateway(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    print(f"📡 Stub gateway aktif di {gw.url}/send (latency {args.latency_ms}ms, error rate {args.error_rate})")
+    try:
+        gw.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Konfigurasi gunicorn untuk wsgi.py. Semua nilai bisa di-override lewat env.
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count() * 2 + 1)))
+# gthread: koneksi SSE /events yang lama terbuka hanya memakan satu thread, bukan satu worker
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "8"))
+timeout = int(os.getenv("WEB_TIMEOUT", "120"))  # /run_now sinkron bisa lama
+graceful_timeout = 30
+# app di-import di tiap worker, bukan di master: koneksi SQLite & thread background tidak boleh ikut fork
+preload_app = False
+accesslog = "-"
+
+
+def worker_exit(server, worker):
+    # lepas lease dispatch supaya worker lain langsung mengambil alih outbox/scheduler
+    from whatsapp_reminder_app import shutdown_app
+    shutdown_app()
@@ -0,0 +1,94 @@
+# manage.py - perintah maintenance dari command line
+# Contoh:
+#   python manage.py import data_kendaraan.xlsx
+#   python manage.py export reminders.csv --status H-1
+#   python manage.py compact-messages --vacuum
+#   python manage.py retention --days 180     (jalankan berkala, mis. cron bulanan)
+import argparse
+import json
+import sys
+
+import whatsapp_reminder_app as app_module
+
+
+def cmd_import(args):
+    app_module.init_db()
+    with open(args.file, 'rb') as f:
+        report = app_module.import_reminders(f, args.file, chunk_size=args.chunk_size, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report["failed"] else 0
+
+
+def cmd_export(args):
+    app_module.init_db()  # mengaktifkan index FTS untuk --q, tanpa ini pencarian jatuh ke LIKE
+    out = open(args.file, 'w', newline='', encoding='utf-8') if args.file != '-' else sys.stdout
+    try:
+        for chunk in app_module.iter_export_csv(status=args.status, q=args.q):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+def cmd_compact_messages(args):
+    app_module.init_db()
+    report = app_module.compact_message_log(batch_size=args.batch_size)
+    if args.vacuum:
+        with app_module.get_db_connection() as con:
+            con.execute("VACUUM")
+        report["vacuumed"] = True
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def cmd_retention(args):
+    app_module.init_db()
+    report = app_module.run_retention(days=args.days, archive_dir=args.archive_dir, dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def cmd_reindex(args):
+    app_module.init_db()
+    app_module.rebuild_search_index()
+    print("index pencarian dibangun ulang")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dishub reminder - perintah maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="Bulk import reminders dari CSV/XLSX (upsert by no_uji)")
+    p.add_argument("file")
+    p.add_argument("--chunk-size", type=int, default=None)
+    p.add_argument("--dry-run", action="store_true", help="validasi saja, tidak menulis ke database")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("export", help="Export reminders ke CSV (streaming)")
+    p.add_argument("file", nargs="?", default="-", help="path output, '-' untuk stdout")
+    p.add_argument("--status", help="Expired | H | H-1 | H-2 | H-3+")
+    p.add_argument("--q", help="kata kunci pencarian")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("compact-messages", help="Migrasi log messages lama ke bentuk ringkas (template id + params)")
+    p.add_argument("--batch-size", type=int, default=5000)
+    p.add_argument("--vacuum", action="store_true", help="VACUUM setelah migrasi supaya ukuran file benar-benar turun")
+    p.set_defaults(func=cmd_compact_messages)
+
+    p = sub.add_parser("retention", help="Arsipkan messages di luar hot window ke file gzip per bulan + incremental vacuum")
+    p.add_argument("--days", type=int, default=None, help="hot window dalam hari (default MESSAGE_RETENTION_DAYS)")
+    p.add_argument("--archive-dir", default=None, help="folder arsip (default ARCHIVE_DIR)")
+    p.add_argument("--dry-run", action="store_true", help="hitung saja, tidak menulis arsip / menghapus")
+    p.set_defaults(func=cmd_retention)
+
+    p = sub.add_parser("reindex", help="Bangun ulang index pencarian (FTS5) dari tabel reminders")
+    p.set_defaults(func=cmd_reindex)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
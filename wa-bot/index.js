@@ -17,13 +17,23 @@ const app = express();
 const AUTH_FOLDER = process.env.AUTH_FOLDER || "./auth_info";
 const port = process.env.PORT || 3000;
 const appName = process.env.APP_NAME || "WhatsApp API Gateway";
+const SEND_INTERVAL_MS = parseInt(process.env.SEND_INTERVAL_MS || "200", 10); // jeda antar pesan keluar (pacing)
+const MAX_BATCH_SIZE = parseInt(process.env.MAX_BATCH_SIZE || "200", 10);     // batas item per /send-batch
+// batas tunggu antrian kalau backend tidak mengirim header X-Max-Wait-Ms (harus < read timeout backend)
+const SEND_MAX_WAIT_MS = parseInt(process.env.SEND_MAX_WAIT_MS || "8000", 10);
+// webhook pesan masuk ke backend Flask (kosongkan untuk menonaktifkan)
+const INBOUND_WEBHOOK_URL = process.env.INBOUND_WEBHOOK_URL ?? "http://localhost:5000/webhook/inbound";
+const INBOUND_WEBHOOK_TOKEN = process.env.WEBHOOK_TOKEN || "";
+const INBOUND_FLUSH_COUNT = parseInt(process.env.INBOUND_FLUSH_COUNT || "50", 10);  // flush kalau buffer sudah sebanyak ini
+const INBOUND_FLUSH_MS = parseInt(process.env.INBOUND_FLUSH_MS || "2000", 10);      // atau paling lambat setelah ini
+const INBOUND_MAX_BUFFER = 5000;                                                   // batas buffer saat backend mati
 
 // 🔹 Fix __dirname di ES Module
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
 // 🔹 Middleware
-app.use(bodyParser.json());
+app.use(bodyParser.json({ limit: "5mb" }));
 app.use(cors());
 app.use(express.static(path.join(__dirname, "..", "Templates")));
 
@@ -147,12 +157,19 @@ async function connectToWhatsApp() {
 
     sock.ev.on('messages.upsert', async (m) => {
       try {
-        const msg = m.messages[0];
-        if (!msg.message) return;
-
-        // proses pesan di sini
-        console.log('Pesan diterima dari:', msg.key.remoteJid);
-
+        if (m.type !== "notify") return; // abaikan sinkronisasi riwayat
+        for (const msg of m.messages) {
+          if (!msg.message || msg.key.fromMe) continue;
+          const jid = msg.key.remoteJid || "";
+          if (!jid.endsWith("@s.whatsapp.net")) continue; // grup, status, broadcast
+          bufferInbound({
+            id: msg.key.id,
+            from: jid,
+            text: extractText(msg.message),
+            timestamp: Number(msg.messageTimestamp) || Math.floor(Date.now() / 1000),
+            push_name: msg.pushName || null,
+          });
+        }
       } catch (err) {
         // Enhanced error handling for message processing
         if (err.message?.includes('Unknown message type') ||
@@ -171,6 +188,117 @@ async function connectToWhatsApp() {
   }
 }
 
+// === WEBHOOK PESAN MASUK ===
+// Pesan masuk dikumpulkan lalu dikirim ke backend per batch (INBOUND_FLUSH_COUNT pesan
+// atau INBOUND_FLUSH_MS), backend menyimpan satu batch dalam satu transaksi & dedup by id.
+let inboundBuffer = [];
+let inboundTimer = null;
+let inboundFlushing = false;
+
+function extractText(message) {
+  return (
+    message.conversation ||
+    message.extendedTextMessage?.text ||
+    message.imageMessage?.caption ||
+    message.videoMessage?.caption ||
+    message.documentMessage?.caption ||
+    message.buttonsResponseMessage?.selectedDisplayText ||
+    message.listResponseMessage?.title ||
+    ""
+  );
+}
+
+function bufferInbound(item) {
+  if (!INBOUND_WEBHOOK_URL) return;
+  inboundBuffer.push(item);
+  if (inboundBuffer.length > INBOUND_MAX_BUFFER) inboundBuffer.splice(0, inboundBuffer.length - INBOUND_MAX_BUFFER);
+  if (inboundBuffer.length >= INBOUND_FLUSH_COUNT) {
+    flushInbound();
+  } else if (!inboundTimer) {
+    inboundTimer = setTimeout(flushInbound, INBOUND_FLUSH_MS);
+  }
+}
+
+async function flushInbound() {
+  clearTimeout(inboundTimer);
+  inboundTimer = null;
+  if (inboundFlushing || inboundBuffer.length === 0) return;
+  inboundFlushing = true;
+  const batch = inboundBuffer.splice(0, inboundBuffer.length);
+  try {
+    const headers = { "Content-Type": "application/json" };
+    if (INBOUND_WEBHOOK_TOKEN) headers["X-Webhook-Token"] = INBOUND_WEBHOOK_TOKEN;
+    const res = await fetch(INBOUND_WEBHOOK_URL, { method: "POST", headers, body: JSON.stringify({ messages: batch }) });
+    if (!res.ok) throw new Error(`HTTP ${res.status}`);
+    console.log(`📥 ${batch.length} pesan masuk diteruskan ke backend`);
+  } catch (err) {
+    // backend belum siap: kembalikan ke buffer, dicoba lagi di flush berikutnya (backend dedup by id)
+    console.error("⚠️ Gagal kirim webhook pesan masuk:", err.message);
+    inboundBuffer = batch.concat(inboundBuffer).slice(-INBOUND_MAX_BUFFER);
+  } finally {
+    inboundFlushing = false;
+    if (inboundBuffer.length && !inboundTimer) inboundTimer = setTimeout(flushInbound, INBOUND_FLUSH_MS);
+  }
+}
+
+// === ANTRIAN KIRIM ===
+// Semua pesan keluar (/send & /send-batch) lewat satu antrian supaya socket dikirimi
+// dengan jeda SEND_INTERVAL_MS, berapapun jumlah request paralel dari backend.
+const sendQueue = [];
+let sendQueueRunning = false;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function enqueueSend(jid, text) {
+  return new Promise((resolve, reject) => {
+    sendQueue.push({ jid, text, resolve, reject });
+    drainSendQueue();
+  });
+}
+
+// Perkiraan lama tunggu sampai n pesan baru selesai dikirim (antrian saat ini + n pesan, dengan jeda).
+function estimatedWaitMs(n) {
+  return (sendQueue.length + n) * SEND_INTERVAL_MS;
+}
+
+// Admission control: request yang tidak akan selesai sebelum backend berhenti menunggu ditolak 429
+// SEBELUM masuk antrian, jadi backend boleh mengulang tanpa risiko pesan terkirim dua kali.
+function rejectIfQueueTooLong(req, res, n) {
+  const header = parseInt(req.get("X-Max-Wait-Ms") || "", 10);
+  const maxWait = Number.isFinite(header) && header >= 0 ? header : SEND_MAX_WAIT_MS;
+  const waitMs = estimatedWaitMs(n);
+  if (waitMs <= maxWait) return false;
+  const retryAfterMs = estimatedWaitMs(0);
+  res.set("Retry-After", String(Math.max(1, Math.ceil(retryAfterMs / 1000))));
+  res.status(429).json({ error: "Antrian kirim penuh, coba lagi nanti", queueDepth: sendQueue.length, waitMs, maxWaitMs: maxWait, retryAfterMs });
+  return true;
+}
+
+async function drainSendQueue() {
+  if (sendQueueRunning) return;
+  sendQueueRunning = true;
+  try {
+    while (sendQueue.length) {
+      const task = sendQueue.shift();
+      if (!isConnected || !sock) {
+        const err = new Error("WhatsApp belum terkoneksi. Scan QR dulu.");
+        err.statusCode = 503;
+        task.reject(err);
+        continue;
+      }
+      try {
+        await sock.sendMessage(task.jid, { text: task.text });
+        task.resolve();
+      } catch (err) {
+        task.reject(err);
+      }
+      if (sendQueue.length && SEND_INTERVAL_MS > 0) await sleep(SEND_INTERVAL_MS);
+    }
+  } finally {
+    sendQueueRunning = false;
+  }
+}
+
 // Helper function for exponential backoff retry
 async function scheduleReconnect() {
   if (reconnectAttempts >= MAX_RECONNECT_ATTEMPTS) {
@@ -286,6 +414,18 @@ app.delete("/reset-auth", async (req, res) => {
   }
 });
 
+// ✅ Status koneksi ringan (dipakai circuit breaker backend untuk health probe)
+app.get("/status", (req, res) => {
+  res.json({
+    connected: Boolean(isConnected && sock),
+    hasQR: Boolean(currentQR),
+    reconnectAttempts,
+    queueDepth: sendQueue.length,
+    sendIntervalMs: SEND_INTERVAL_MS,
+    uptime: Math.round(process.uptime()),
+  });
+});
+
 // ✅ Kirim pesan
 app.post("/send", async (req, res) => {
   try {
@@ -297,11 +437,47 @@ app.post("/send", async (req, res) => {
       return res.status(503).json({ error: "WhatsApp belum terkoneksi. Scan QR dulu." });
 
     const jid = formatPhoneNumber(phone);
-    await sock.sendMessage(jid, { text: message });
+    if (rejectIfQueueTooLong(req, res, 1)) return;
+    await enqueueSend(jid, message);
 
     res.json({ success: true, to: jid, message });
   } catch (err) {
     console.error("❌ Gagal kirim WA:", err);
+    res.status(err.statusCode || 500).json({ error: err.toString() });
+  }
+});
+
+// ✅ Kirim banyak pesan sekaligus: [{phone, message, client_id}] atau {items: [...]}
+app.post("/send-batch", async (req, res) => {
+  try {
+    const items = Array.isArray(req.body) ? req.body : req.body?.items;
+    if (!Array.isArray(items) || items.length === 0)
+      return res.status(400).json({ error: "Body harus array {phone, message, client_id} atau {items: [...]}" });
+    if (items.length > MAX_BATCH_SIZE)
+      return res.status(413).json({ error: `Maksimal ${MAX_BATCH_SIZE} pesan per batch` });
+
+    if (!isConnected || !sock)
+      return res.status(503).json({ error: "WhatsApp belum terkoneksi. Scan QR dulu." });
+    if (rejectIfQueueTooLong(req, res, items.length)) return;
+
+    const results = await Promise.all(items.map(async (item, i) => {
+      const clientId = item?.client_id ?? String(i);
+      const { phone, message } = item || {};
+      if (!phone || !message)
+        return { client_id: clientId, success: false, status: 400, error: "Field 'phone' dan 'message' wajib diisi" };
+      try {
+        const jid = formatPhoneNumber(phone);
+        await enqueueSend(jid, message);
+        return { client_id: clientId, success: true, to: jid };
+      } catch (err) {
+        return { client_id: clientId, success: false, status: err.statusCode || 500, error: err.message || err.toString() };
+      }
+    }));
+
+    const sent = results.filter((r) => r.success).length;
+    res.json({ success: sent === results.length, sent, failed: results.length - sent, results });
+  } catch (err) {
+    console.error("❌ Gagal kirim batch WA:", err);
     res.status(500).json({ error: err.toString() });
   }
 });
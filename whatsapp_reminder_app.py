@@ -1,18 +1,89 @@
 # backend.py
 import os
 import sqlite3
-from datetime import datetime, date
-from flask import Flask, request, jsonify, render_template, send_from_directory
+import json
+import ast
+import re
+import string
+import base64
+import csv
+import gzip
+import io
+import itertools
+import socket
+import uuid
+from datetime import datetime, date, timedelta
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_with_context, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 import requests
 import shutil
+import threading
+import heapq
+import time
+import queue
+import atexit
+import logging
+import hashlib
+import functools
+from collections import Counter, OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from werkzeug.utils import secure_filename
 
 load_dotenv()
 
 DB_PATH = 'reminders.db'
 NODE_API = os.getenv("NODE_API_URL", "http://localhost:3000/send")  # Node API endpoint
+# endpoint health bot untuk probe circuit breaker (default: /status di host yang sama)
+NODE_STATUS_URL = os.getenv("NODE_STATUS_URL", NODE_API.rsplit("/", 1)[0] + "/status")
+NODE_BATCH_API = os.getenv("NODE_BATCH_API_URL", NODE_API.rsplit("/", 1)[0] + "/send-batch")
+GATEWAY_TIMEOUT_SEC = float(os.getenv("GATEWAY_TIMEOUT_SEC", "10"))
+GATEWAY_BATCH_SIZE = int(os.getenv("GATEWAY_BATCH_SIZE", "50"))              # pesan per /send-batch (<= 1 = pakai /send satu-satu)
+GATEWAY_BATCH_TIMEOUT_SEC = float(os.getenv("GATEWAY_BATCH_TIMEOUT_SEC", "120"))  # read timeout batch; bot mengirim dengan jeda
+GATEWAY_PROBE_TIMEOUT_SEC = float(os.getenv("GATEWAY_PROBE_TIMEOUT_SEC", "2"))
+GATEWAY_BREAKER_THRESHOLD = int(os.getenv("GATEWAY_BREAKER_THRESHOLD", "3"))        # kegagalan beruntun sebelum circuit terbuka
+GATEWAY_BREAKER_COOLDOWN_SEC = float(os.getenv("GATEWAY_BREAKER_COOLDOWN_SEC", "30"))  # jeda sebelum probe ulang
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "8"))       # jumlah worker kirim paralel
+SEND_RATE_PER_SEC = float(os.getenv("SEND_RATE_PER_SEC", "5"))   # batas pesan/detik ke gateway (0 = tanpa batas)
+# offset hari sebelum test_date kapan reminder dikirim (H-7, H-3, H-1, H)
+REMINDER_STAGES = sorted({int(x) for x in os.getenv("REMINDER_STAGES", "7,3,1,0").split(",") if x.strip()}, reverse=True)
+RUN_MODE = os.getenv("RUN_MODE", "window")  # window = hanya yang jatuh tempo per stage, all = semua yang belum lewat (perilaku lama)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+MESSAGE_LOG_BUFFERED = os.getenv("MESSAGE_LOG_BUFFERED", "1") == "1"  # tulis log messages secara batch di background
+MESSAGE_LOG_FLUSH_SEC = float(os.getenv("MESSAGE_LOG_FLUSH_SEC", "0.5"))  # batas waktu maksimal row menunggu di buffer
+MESSAGE_LOG_BATCH_SIZE = int(os.getenv("MESSAGE_LOG_BATCH_SIZE", "500"))
+MESSAGE_LOG_COMPACT = os.getenv("MESSAGE_LOG_COMPACT", "1") == "1"  # simpan id template + params, bukan teks penuh
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))  # batas jumlah error yang dilaporkan per import
+MESSAGE_RETENTION_DAYS = int(os.getenv("MESSAGE_RETENTION_DAYS", "180"))  # hot window tabel messages; lebih tua -> arsip
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")                          # folder arsip messages-YYYY-MM-*.jsonl.gz
+WEBHOOK_TOKEN = os.getenv("WEBHOOK_TOKEN", "")  # kalau diisi, webhook bot wajib kirim header X-Webhook-Token yang sama
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()   # DEBUG menampilkan payload/response tiap kirim
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")          # text | json
+LOG_SQL = os.getenv("LOG_SQL", "0") == "1"            # log setiap statement SQL (level DEBUG)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", "60"))  # juga membatasi umur status H/H-1 yang bergantung tanggal
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))      # event tertahan per klien SSE sebelum di-resync
+EVENTS_HISTORY = int(os.getenv("EVENTS_HISTORY", "500"))             # event terakhir untuk replay Last-Event-ID
+EVENTS_KEEPALIVE_SEC = float(os.getenv("EVENTS_KEEPALIVE_SEC", "15"))
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "1") == "1"              # jalankan background worker outbox
+OUTBOX_POLL_SEC = float(os.getenv("OUTBOX_POLL_SEC", "5"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_BASE_SEC = float(os.getenv("OUTBOX_BACKOFF_BASE_SEC", "30"))  # 30s, 60s, 120s, ...
+OUTBOX_STALE_SEC = float(os.getenv("OUTBOX_STALE_SEC", "300"))      # job 'sending' lebih lama dari ini dianggap macet
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "0") == "1"      # kirim otomatis per stage tanpa menunggu /run_now
+SCHEDULER_SEND_HOUR = int(os.getenv("SCHEDULER_SEND_HOUR", "8"))    # jam lokal pengiriman reminder tiap stage
+SCHEDULER_HORIZON_DAYS = int(os.getenv("SCHEDULER_HORIZON_DAYS", "1"))  # hari ekstra di luar stage terbesar yang dimuat ke heap
+MULTI_WORKER = os.getenv("MULTI_WORKER", "0") == "1"                # banyak proses (gunicorn): event & cache disinkronkan lewat DB
+LEASE_TTL_SEC = float(os.getenv("LEASE_TTL_SEC", "30"))              # lease lepas kalau pemegang tidak memperbarui selama ini
+SCHEMA_LEASE_WAIT_SEC = float(os.getenv("SCHEMA_LEASE_WAIT_SEC", "120"))  # batas tunggu worker lain selesai migrasi skema
+EVENTS_RELAY_POLL_SEC = float(os.getenv("EVENTS_RELAY_POLL_SEC", "0.5"))  # jeda tail tabel event_relay per worker
+EVENTS_RELAY_KEEP_SEC = float(os.getenv("EVENTS_RELAY_KEEP_SEC", "600"))  # umur row event_relay sebelum dihapus
 
 app = Flask(__name__, static_folder='static', template_folder='templates')
 CORS(app)
@@ -25,17 +96,589 @@ UPLOAD_FOLDER = os.path.join(app.static_folder, 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# ----------------- LOGGING -----------------
+logger = logging.getLogger("dishub_reminder")
+
+class TextLogFormatter(logging.Formatter):
+    """`2025-01-01 10:00:00 INFO event key=value ...`"""
+
+    def format(self, record):
+        line = f"{self.formatTime(record)} {record.levelname} {record.getMessage()}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class JsonLogFormatter(logging.Formatter):
+    """Satu objek JSON per baris, cocok untuk dikirim ke log collector."""
+
+    def format(self, record):
+        data = {"ts": self.formatTime(record), "level": record.levelname, "event": record.getMessage()}
+        data.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+def configure_logging(level=None, fmt=None):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonLogFormatter() if (fmt or LOG_FORMAT) == "json" else TextLogFormatter())
+    logger.handlers[:] = [handler]
+    logger.setLevel(level or LOG_LEVEL)
+    logger.propagate = False
+
+def log_event(level, event, **fields):
+    """Log terstruktur. Dicek isEnabledFor dulu supaya di hot path (mis. DEBUG per pesan) nyaris tanpa biaya."""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+configure_logging()
+
+# ----------------- METRICS -----------------
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_metrics_registry = []
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        _metrics_registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class GaugeMetric(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), func=None):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+        self.func = func  # kalau diisi, nilai dihitung saat scrape
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def samples(self):
+        if self.func is not None:
+            try:
+                return [f"{self.name} {self.func()}"]
+            except Exception as e:
+                log_event(logging.WARNING, "metric gauge gagal", metric=self.name, error=e)
+                return []
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # key -> [bucket_counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self.series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            for bound, c in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {c}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render_metrics():
+    lines = []
+    for metric in _metrics_registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+HTTP_LATENCY = HistogramMetric("http_request_duration_seconds", "Latency request Flask per route", ("route", "method", "status"))
+GATEWAY_LATENCY = HistogramMetric("gateway_request_duration_seconds", "Latency panggilan Node API", ("endpoint", "outcome"))
+GATEWAY_CALLS = CounterMetric("gateway_requests_total", "Jumlah panggilan Node API per hasil", ("endpoint", "outcome", "code"))
+DB_QUERY_LATENCY = HistogramMetric(
+    "db_query_duration_seconds", "Waktu execute SQLite per jenis statement", ("op",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+)
+LAST_RUN_DURATION = GaugeMetric("reminder_last_run_duration_seconds", "Durasi run_now_check terakhir")
+LAST_RUN_MESSAGES = GaugeMetric("reminder_last_run_messages", "Jumlah reminder yang diproses run terakhir")
+LAST_RUN_TIMESTAMP = GaugeMetric("reminder_last_run_timestamp_seconds", "Waktu selesai run terakhir (unix)")
+
+@app.before_request
+def _metrics_start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def _metrics_observe_request(response):
+    started = getattr(g, "request_started", None)
+    if METRICS_ENABLED and started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method, status=response.status_code)
+    return response
+
+# ----------------- RESPONSE CACHE -----------------
+# Versi data global: setiap penulisan reminders/messages menaikkan versi, cache dengan versi lama otomatis basi.
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+def bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+        return _data_version
+
+def get_data_version():
+    """
+    Versi data proses ini. Multi-worker: commit dari proses lain terlihat lewat PRAGMA data_version
+    koneksi thread ini (murah, tanpa tabel tambahan) dan ikut menaikkan versi supaya cache tidak basi.
+    """
+    if MULTI_WORKER:
+        con = get_db_connection()
+        seen = con.execute("PRAGMA data_version").fetchone()[0]
+        if getattr(con, "seen_data_version", None) != seen:
+            con.seen_data_version = seen
+            bump_data_version()
+    return _data_version
+
+CACHE_LOOKUPS = CounterMetric("response_cache_lookups_total", "Lookup response cache per hasil", ("endpoint", "result"))
+
+class ResponseCache:
+    """LRU + TTL untuk body response; entry hanya valid selama versi data belum berubah."""
+
+    def __init__(self, max_entries, ttl_sec):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.entries = OrderedDict()  # key -> (version, expires_at, body, mimetype, etag)
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version or entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, mimetype, etag):
+        entry = (version, time.monotonic() + self.ttl_sec, body, mimetype, etag)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SEC)
+
+def _cached_reply(entry):
+    resp = Response(entry[2], mimetype=entry[3])
+    resp.set_etag(entry[4])
+    resp.headers["Cache-Control"] = "no-cache"  # browser wajib revalidasi -> dapat 304 kalau ETag sama
+    return resp.make_conditional(request)
+
+def cached_response(view):
+    """Cache response GET 200 per (path, query args) dan tambahkan ETag supaya browser dapat 304."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not RESPONSE_CACHE_ENABLED:
+            return view(*args, **kwargs)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        version = get_data_version()
+        entry = response_cache.get(key, version)
+        if entry is not None:
+            CACHE_LOOKUPS.inc(endpoint=request.endpoint, result="hit")
+            return _cached_reply(entry)
+        CACHE_LOOKUPS.inc(endpoint=request.endpoint, result="miss")
+        resp = app.make_response(view(*args, **kwargs))
+        if resp.status_code != 200 or resp.is_streamed:
+            return resp
+        body = resp.get_data()
+        etag = hashlib.sha1(body).hexdigest()
+        return _cached_reply(response_cache.put(key, version, body, resp.mimetype, etag))
+    return wrapper
+
+# ----------------- EVENTS (SSE) -----------------
+class EventSubscriber:
+    """Satu klien SSE: queue terbatas; kalau penuh (klien lambat) isinya diganti satu event 'resync'."""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+
+    def push(self, item):
+        with self.lock:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+                self.queue.put_nowait((item[0], "resync", "{}"))
+
+    def get(self, timeout):
+        return self.queue.get(timeout=timeout)
+
+class EventBroadcaster:
+    """
+    Fan-out event operasional ke semua klien /events. publish() dipanggil sekali di jalur tulis,
+    tiap klien hanya membaca queue-nya sendiri (tanpa query DB per klien).
+    History pendek dipakai untuk replay saat EventSource reconnect dengan Last-Event-ID.
+    """
+
+    def __init__(self, queue_size=None, history=None):
+        self.queue_size = EVENTS_QUEUE_SIZE if queue_size is None else queue_size
+        self.history = deque(maxlen=EVENTS_HISTORY if history is None else history)
+        self.subscribers = set()
+        self.seq = 0
+        self.lock = threading.Lock()
+
+    def publish(self, event, data, seq=None):
+        """data: dict atau payload JSON yang sudah jadi; seq diisi EventRelay supaya id sama di semua worker."""
+        payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        with self.lock:
+            self.seq = self.seq + 1 if seq is None else seq
+            item = (self.seq, event, payload)
+            self.history.append(item)
+            subscribers = list(self.subscribers)
+        for sub in subscribers:
+            sub.push(item)
+
+    def subscribe(self, last_id=None):
+        sub = EventSubscriber(self.queue_size)
+        with self.lock:
+            if last_id is not None:
+                if self.history and last_id < self.history[0][0] - 1 or last_id > self.seq:
+                    sub.push((self.seq, "resync", "{}"))  # event yang terlewat sudah tidak ada di history
+                else:
+                    for item in self.history:
+                        if item[0] > last_id:
+                            sub.push(item)
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+event_broadcaster = EventBroadcaster()
+EVENTS_CLIENTS = GaugeMetric("events_clients", "Jumlah klien SSE /events yang terhubung",
+                             func=lambda: len(event_broadcaster.subscribers))
+
+class EventRelay(threading.Thread):
+    """
+    Multi-worker: publish_event ditulis ke tabel event_relay dan tiap proses men-tail tabel itu,
+    jadi klien /events di worker mana pun menerima event yang sama dengan id yang sama
+    (Last-Event-ID tetap valid walau reconnect mendarat di worker lain).
+    Event ditampung di memori dan ditulis satu transaksi per EVENTS_RELAY_POLL_SEC;
+    send.progress per run digabung (hanya angka terakhir yang dipakai dashboard).
+    """
+
+    def __init__(self, poll_sec=None):
+        super().__init__(name="event-relay", daemon=True)
+        self.poll_sec = EVENTS_RELAY_POLL_SEC if poll_sec is None else poll_sec
+        self.origin = f"{socket.gethostname()}:{os.getpid()}"
+        self.last_id = None
+        self.pending = []          # (origin, event, payload, created_at) menunggu flush
+        self.progress_index = {}   # run -> posisi send.progress di pending
+        self.lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def publish(self, event, data):
+        item = (self.origin, event, json.dumps(data, ensure_ascii=False, separators=(",", ":")), time.time())
+        with self.lock:
+            index = self.progress_index.get(data.get('run')) if event == "send.progress" else None
+            if index is not None:
+                self.pending[index] = item
+            else:
+                if event == "send.progress":
+                    self.progress_index[data.get('run')] = len(self.pending)
+                self.pending.append(item)
+            full = len(self.pending) >= 1000
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        with self.lock:
+            rows, self.pending, self.progress_index = self.pending, [], {}
+        if not rows:
+            return 0
+        try:
+            with get_db_connection() as con:
+                con.executemany("INSERT INTO event_relay (origin, event, payload, created_at) VALUES (?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            # event hanya untuk tampilan live; data aslinya sudah tersimpan
+            log_event(logging.WARNING, "event relay gagal ditulis", events=len(rows), error=e)
+            return 0
+        return len(rows)
+
+    def poll(self):
+        with get_db_connection() as con:
+            if self.last_id is None:
+                # event sebelum proses ini start tidak di-replay; id lanjut dari yang terakhir
+                self.last_id = con.execute("SELECT COALESCE(MAX(id), 0) FROM event_relay").fetchone()[0]
+                event_broadcaster.seq = self.last_id
+                return 0
+            rows = con.execute(
+                "SELECT id, origin, event, payload FROM event_relay WHERE id > ? ORDER BY id LIMIT 1000",
+                (self.last_id,)
+            ).fetchall()
+        for row in rows:
+            self.last_id = row['id']
+            event_broadcaster.publish(row['event'], row['payload'], seq=row['id'])
+            if row['origin'] != self.origin:
+                apply_remote_event(row['event'], row['payload'])
+        return len(rows)
+
+    def prune(self):
+        with get_db_connection() as con:
+            con.execute("DELETE FROM event_relay WHERE created_at < ?", (time.time() - EVENTS_RELAY_KEEP_SEC,))
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        last_prune = 0
+        while not self._stopping.is_set():
+            try:
+                self.flush()
+                if self.poll() >= 1000:
+                    continue
+                if time.monotonic() - last_prune > EVENTS_RELAY_KEEP_SEC / 10:
+                    self.prune()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                log_event(logging.ERROR, "event relay error", error=e)
+            self._wake.wait(self.poll_sec)
+            self._wake.clear()
+        self.flush()
+        close_db_connection()
+
+_event_relay = None
+
+def start_event_relay():
+    global _event_relay
+    if _event_relay is None:
+        relay = EventRelay()
+        relay.poll()  # tetapkan posisi awal sebelum event pertama dari proses ini ditulis
+        relay.start()
+        _event_relay = relay
+    return _event_relay
+
+def apply_remote_event(event, payload):
+    """Event dari worker lain: samakan heap scheduler kalau scheduler jalan di proses ini."""
+    if _scheduler is None:
+        return
+    data = json.loads(payload)
+    if event in ("reminder.created", "reminder.updated"):
+        _scheduler.upsert(data['id'], data['test_date'])
+    elif event == "reminder.deleted":
+        _scheduler.remove(data['id'])
+    elif event == "reminders.cleared":
+        _scheduler.clear()
+    elif event == "reminders.imported":
+        _scheduler.load_window()
+
+def publish_event(event, **data):
+    if _event_relay is not None:
+        _event_relay.publish(event, data)
+    else:
+        event_broadcaster.publish(event, data)
+
+def publish_message_counts(counts):
+    """counts: Counter {(day, direction, status): n} -> satu event 'counter' berisi increment rollup."""
+    if counts:
+        publish_event("counter", items=[
+            {"day": day, "direction": direction, "status": status, "n": n}
+            for (day, direction, status), n in counts.items()
+        ])
+
 # ----------------- DATABASE -----------------
+_db_local = threading.local()
+
+class TracedConnection(sqlite3.Connection):
+    """Connection yang mencatat waktu execute/executemany ke DB_QUERY_LATENCY."""
+
+    def execute(self, sql, *args):
+        if not METRICS_ENABLED:
+            return super().execute(sql, *args)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, op=_sql_op(sql))
+
+    def executemany(self, sql, *args):
+        if not METRICS_ENABLED:
+            return super().executemany(sql, *args)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            DB_QUERY_LATENCY.observe(time.perf_counter() - started, op=_sql_op(sql) + "_many")
+
+def _sql_op(sql):
+    words = sql.lstrip().split(None, 1)
+    return words[0].upper() if words else "UNKNOWN"
+
+def apply_pragmas(con):
+    # auto_vacuum hanya bisa diset di file kosong dan SEBELUM journal_mode=WAL (setelahnya diabaikan diam-diam);
+    # DB lama dikonversi sekali oleh `manage.py retention`
+    if con.execute("PRAGMA page_count").fetchone()[0] == 0:
+        con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WAL: pembaca tidak memblok penulis; synchronous=NORMAL cukup aman di WAL dan jauh lebih sedikit fsync
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    con.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    con.execute("PRAGMA temp_store=MEMORY")
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    Koneksi SQLite per-thread yang dipakai ulang (tidak perlu di-close oleh pemanggil).
+    Pakai `with get_db_connection() as con:` seperti biasa; blok with hanya commit/rollback.
+    """
+    conns = getattr(_db_local, 'conns', None)
+    if conns is None:
+        conns = _db_local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000, factory=TracedConnection)
+        conn.row_factory = sqlite3.Row
+        if LOG_SQL:
+            conn.set_trace_callback(lambda stmt: log_event(logging.DEBUG, "sql", statement=stmt))
+        apply_pragmas(conn)
+        conns[DB_PATH] = conn
     return conn
 
+def close_db_connection():
+    """Tutup koneksi milik thread ini (mis. sebelum ganti DB_PATH)."""
+    conns = getattr(_db_local, 'conns', None) or {}
+    for conn in conns.values():
+        conn.close()
+    conns.clear()
+
+def ensure_column(con, table, column, decl):
+    """ALTER TABLE ADD COLUMN kalau kolom belum ada (migrasi DB lama)."""
+    cols = {row[1] for row in con.execute(f"PRAGMA table_info({table})")}
+    if column not in cols:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+        log_event(logging.INFO, "migrasi kolom", table=table, column=column)
+
+def create_outbox_table(con, name="outbox"):
+    # outbox: antrian kirim yang tahan restart; idempotency_key mencegah kirim ganda.
+    # Job reminder hanya menyimpan template + params (message NULL), teks dirender saat dikirim.
+    con.execute(f'''CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        reminder_id INTEGER,
+        stage TEXT,
+        phone TEXT,
+        message TEXT,
+        status TEXT NOT NULL DEFAULT 'pending', -- pending|sending|sent|unconfirmed|dead
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        template_id TEXT,
+        template_version INTEGER,
+        params TEXT
+    )''')
+
+def migrate_outbox_message_nullable(con):
+    """Outbox dari skema lama punya message NOT NULL; SQLite tidak bisa ALTER constraint -> salin ke tabel baru."""
+    if not any(row[1] == "message" and row[3] for row in con.execute("PRAGMA table_info(outbox)")):
+        return
+    cols = ("id, idempotency_key, reminder_id, stage, phone, message, status, attempts, next_attempt_at, "
+            "last_error, created_at, updated_at, template_id, template_version, params")
+    con.execute("SAVEPOINT migrate_outbox")
+    try:
+        create_outbox_table(con, "outbox_new")
+        con.execute(f"INSERT INTO outbox_new ({cols}) SELECT {cols} FROM outbox")
+        con.execute("DROP TABLE outbox")  # index ikut terhapus, dibuat ulang oleh init_db
+        con.execute("ALTER TABLE outbox_new RENAME TO outbox")
+    except Exception:
+        con.execute("ROLLBACK TO migrate_outbox")
+        raise
+    finally:
+        con.execute("RELEASE migrate_outbox")
+    log_event(logging.INFO, "migrasi outbox: message boleh NULL")
+
 def init_db():
+    """
+    Buat/migrasi skema; aman dipanggil berulang. Banyak worker yang start bersamaan
+    menjalankan migrasi bergiliran lewat lease 'schema'.
+    """
     with get_db_connection() as con:
+        fresh = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='reminders'").fetchone() is None
+        con.execute('''CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL  -- unix time; lewat dari ini lease boleh diambil proses lain
+        )''')
+    with Lease("schema", ttl=SCHEMA_LEASE_WAIT_SEC, wait=SCHEMA_LEASE_WAIT_SEC), get_db_connection() as con:
+        rollups_exist = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='message_counts_daily'"
+        ).fetchone() is not None
         con.execute('''CREATE TABLE IF NOT EXISTS reminders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
+            nik TEXT,
             vehicle_number TEXT NOT NULL,
             no_uji TEXT,
             jenis_kendaraan TEXT,
@@ -52,6 +695,139 @@ def init_db():
             meta TEXT,
             created_at TEXT NOT NULL
         )''')
+        create_outbox_table(con)
+        ensure_column(con, "outbox", "template_id", "TEXT")
+        ensure_column(con, "outbox", "template_version", "INTEGER")
+        ensure_column(con, "outbox", "params", "TEXT")
+        migrate_outbox_message_nullable(con)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_outbox_status_next ON outbox(status, next_attempt_at)")
+        # test_date harus murni YYYY-MM-DD supaya bisa dicocokkan langsung lewat index
+        con.execute("UPDATE reminders SET test_date = substr(test_date, 1, 10) WHERE length(test_date) > 10")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_test_date ON reminders(test_date)")
+        init_no_uji_index(con)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_phone ON reminders(phone)")
+        # DB produksi lama sudah punya kolom nik, DB dari skema sebelumnya belum
+        ensure_column(con, "reminders", "nik", "TEXT")
+        # pesan masuk: id WhatsApp untuk dedup webhook + tautan ke reminder pemilik nomor
+        ensure_column(con, "messages", "wa_message_id", "TEXT")
+        ensure_column(con, "messages", "reminder_id", "INTEGER")
+        # log ringkas: teks pesan outbound dirender ulang dari registry template (message = NULL)
+        ensure_column(con, "messages", "template_id", "TEXT")
+        ensure_column(con, "messages", "template_version", "INTEGER")
+        ensure_column(con, "messages", "params", "TEXT")
+        con.execute("CREATE INDEX IF NOT EXISTS idx_messages_created_at ON messages(created_at)")
+        con.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_wa_id ON messages(wa_message_id) WHERE wa_message_id IS NOT NULL")
+        # rollup jumlah pesan per hari/bulan, di-update oleh log_message (dipakai /api/stats & timeseries)
+        con.execute('''CREATE TABLE IF NOT EXISTS message_counts_daily (
+            day TEXT NOT NULL,        -- YYYY-MM-DD (UTC, sama dengan messages.created_at)
+            direction TEXT NOT NULL,
+            status TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, direction, status)
+        )''')
+        con.execute('''CREATE TABLE IF NOT EXISTS message_counts_monthly (
+            month TEXT NOT NULL,      -- YYYY-MM
+            direction TEXT NOT NULL,
+            status TEXT NOT NULL,
+            cnt INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, direction, status)
+        )''')
+        if not rollups_exist:
+            backfill_message_rollups(con)
+        init_search_index(con)
+        # multi-worker: event SSE dibagikan antar proses lewat tabel ini (lihat EventRelay)
+        con.execute('''CREATE TABLE IF NOT EXISTS event_relay (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            origin TEXT NOT NULL,     -- host:pid penulis
+            event TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )''')
+        con.execute("CREATE INDEX IF NOT EXISTS idx_event_relay_created_at ON event_relay(created_at)")
+        if fresh and con.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # DB baru seharusnya sudah incremental (lihat apply_pragmas); kalau tidak, retention akan VACUUM penuh
+            log_event(logging.WARNING, "DB baru tanpa auto_vacuum=INCREMENTAL", path=DB_PATH)
+
+# ----------------- LEASES -----------------
+class LeaseUnavailable(Exception):
+    """Lease sedang dipegang proses lain."""
+
+class Lease:
+    """
+    Kunci lintas proses di tabel leases: satu pemegang per nama sampai expires_at lewat.
+    Pemegang memperbarui lease sebelum TTL habis; proses yang mati otomatis kehilangan lease.
+    Pakai `with Lease(name):` untuk satu pekerjaan (diperbarui di background selama blok berjalan)
+    atau acquire()/release() manual untuk peran jangka panjang (lihat DispatchLeader).
+    """
+
+    def __init__(self, name, ttl=None, wait=0):
+        self.name = name
+        self.ttl = LEASE_TTL_SEC if ttl is None else ttl
+        self.wait = wait
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = False
+        self._done = threading.Event()
+        self._renewer = None
+
+    def acquire(self):
+        """Ambil atau perpanjang lease (satu statement, atomik). Return True kalau lease milik kita."""
+        now = time.time()
+        with get_db_connection() as con:
+            cur = con.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                (self.name, self.owner, now + self.ttl, now)
+            )
+        self.held = cur.rowcount > 0
+        return self.held
+
+    def renew(self):
+        """Perpanjang lease yang masih milik kita; UPDATE saja supaya tidak bisa menghidupkan lagi row yang sudah dilepas."""
+        with get_db_connection() as con:
+            cur = con.execute("UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+                              (time.time() + self.ttl, self.name, self.owner))
+        self.held = cur.rowcount > 0
+        return self.held
+
+    def release(self):
+        with get_db_connection() as con:
+            con.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (self.name, self.owner))
+        self.held = False
+
+    def _keep_alive(self):
+        while not self._done.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    log_event(logging.WARNING, "lease hilang", name=self.name, owner=self.owner)
+                    break
+            except sqlite3.Error as e:
+                log_event(logging.ERROR, "lease renew error", name=self.name, error=e)
+        close_db_connection()
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.wait
+        while not self.acquire():
+            if time.monotonic() >= deadline:
+                raise LeaseUnavailable(self.name)
+            time.sleep(0.2)
+        self._done.clear()
+        self._renewer = threading.Thread(target=self._keep_alive, name=f"lease-{self.name}", daemon=True)
+        self._renewer.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._renewer.join()  # renew yang sedang jalan harus selesai sebelum row dihapus
+        self.release()
+
+def lease_holder(name):
+    """Pemegang lease yang masih berlaku (owner + sisa detik), None kalau kosong/kedaluwarsa."""
+    with get_db_connection() as con:
+        row = con.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+    if row is None or row['expires_at'] < time.time():
+        return None
+    return {"owner": row['owner'], "expires_in": round(row['expires_at'] - time.time(), 1)}
 
 # ----------------- HELPERS -----------------
 def add_reminder(name, nik, vehicle_number, test_date, phone=None):
@@ -65,15 +841,39 @@ def add_reminder(name, nik, vehicle_number, test_date, phone=None):
     no_uji = None
     jenis_kendaraan = None
     if isinstance(phone, dict):
-        no_uji = phone.get('no_uji')
+        no_uji = phone.get('no_uji') or None  # kosong -> NULL, index unik no_uji mengizinkan banyak NULL
         jenis_kendaraan = phone.get('jenis_kendaraan')
         phone = phone.get('phone')
 
-    with get_db_connection() as con:
-        con.execute(
-            'INSERT INTO reminders (name, vehicle_number, no_uji, jenis_kendaraan, test_date, phone, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
-            (name, vehicle_number, no_uji, jenis_kendaraan, test_date, phone, datetime.utcnow().isoformat())
-        )
+    try:
+        with get_db_connection() as con:
+            cur = con.execute(
+                'INSERT INTO reminders (name, nik, vehicle_number, no_uji, jenis_kendaraan, test_date, phone, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (name, nik, vehicle_number, no_uji, jenis_kendaraan, test_date, phone, datetime.utcnow().isoformat())
+            )
+    except sqlite3.IntegrityError:
+        raise ValueError(f"❌ no_uji {no_uji} sudah terdaftar")
+    bump_data_version()
+    schedule_reminder(cur.lastrowid, test_date)
+    publish_event("reminder.created", id=cur.lastrowid, name=name, vehicle_number=vehicle_number, test_date=test_date)
+    return cur.lastrowid
+
+def decorate_reminder(row, today=None):
+    """Tambahkan status/color/days_until ke satu row reminders. Return None kalau test_date rusak."""
+    r = dict(row)
+    today = date.today() if today is None else today
+    raw_date = str(r['test_date']).split()[0]
+    try:
+        test_date = datetime.strptime(raw_date, '%Y-%m-%d').date()
+    except:
+        return None
+    days_until = (test_date - today).days
+    status_label, color = classify_by_days(days_until)
+    r['status'] = status_label
+    r['color'] = color
+    r['days_until'] = days_until  # penting untuk frontend filter
+    r['test_date'] = test_date.strftime("%Y-%m-%d")  # normalisasi
+    return r
 
 def list_reminders():
     with get_db_connection() as con:
@@ -81,21 +881,226 @@ def list_reminders():
         results = []
         today = date.today()
         for row in rows:
-            r = dict(row)
-            raw_date = str(r['test_date']).split()[0]
-            try:
-                test_date = datetime.strptime(raw_date, '%Y-%m-%d').date()
-            except:
-                continue
-            days_until = (test_date - today).days
-            status_label, color = classify_by_days(days_until)
-            r['status'] = status_label
-            r['color'] = color
-            r['days_until'] = days_until  # penting untuk frontend filter
-            r['test_date'] = test_date.strftime("%Y-%m-%d")  # normalisasi
-            results.append(r)
+            r = decorate_reminder(row, today)
+            if r is not None:
+                results.append(r)
         return results
 
+def get_reminder(reminder_id):
+    with get_db_connection() as con:
+        row = con.execute("SELECT * FROM reminders WHERE id = ?", (reminder_id,)).fetchone()
+    return decorate_reminder(row) if row else None
+
+LIST_SORT_COLUMNS = ('id', 'name', 'vehicle_number', 'no_uji', 'jenis_kendaraan', 'test_date', 'phone', 'created_at')
+LIST_NULLABLE_COLUMNS = ('no_uji', 'jenis_kendaraan', 'phone')  # di-COALESCE supaya keyset cursor tidak melompati NULL
+LIST_MAX_PER_PAGE = 500
+
+def status_filter_sql(status, today):
+    """Terjemahkan filter status (Expired/H/H-1/H-3+) ke kondisi test_date yang bisa pakai index."""
+    d0 = today.isoformat()
+    d1 = (today + timedelta(days=1)).isoformat()
+    d2 = (today + timedelta(days=2)).isoformat()
+    mapping = {
+        'Expired': ("test_date < ?", [d0]),
+        'H': ("test_date = ?", [d0]),
+        'H (today)': ("test_date = ?", [d0]),
+        'H-1': ("test_date = ?", [d1]),
+        'H-2': ("test_date = ?", [d2]),
+        'H-3+': ("test_date > ?", [d2]),       # H-2 punya kartu sendiri; bucket tidak boleh tumpang tindih
+        'H-3 or more': ("test_date > ?", [d2]),
+    }
+    if status not in mapping:
+        raise ValueError(f"status tidak dikenal: {status}")
+    return mapping[status]
+
+def encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    return sort_value, int(row_id)
+
+def query_reminders(page=1, per_page=25, sort='test_date', order='asc', status=None, q=None, cursor=None):
+    """
+    Satu halaman tabel reminders, dikerjakan di SQLite.
+    - page/per_page: pagination offset; cursor: keyset pagination (lebih stabil untuk data besar)
+    - sort/order: kolom whitelist LIST_SORT_COLUMNS
+    - status: Expired | H | H-1 | H-3+
+    - q: cari di name, vehicle_number, no_uji, phone (index FTS5, lihat search_filter_sql)
+    Return dict {data, total, filtered, page, per_page, next_cursor}.
+    """
+    if sort not in LIST_SORT_COLUMNS:
+        raise ValueError(f"sort tidak dikenal: {sort}")
+    desc = str(order).lower() == 'desc'
+    per_page = max(1, min(int(per_page), LIST_MAX_PER_PAGE))
+    page = max(1, int(page))
+    today = date.today()
+    sort_expr = f"COALESCE({sort}, '')" if sort in LIST_NULLABLE_COLUMNS else sort
+
+    where, params = [], []
+    if status and status != 'Semua Data':
+        clause, args = status_filter_sql(status, today)
+        where.append(clause)
+        params += args
+    search = search_filter_sql(q) if q else None
+    if search:
+        where.append(search[0])
+        params += search[1]
+    filter_sql = (" WHERE " + " AND ".join(where)) if where else ""
+
+    page_where, page_params = list(where), list(params)
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        page_where.append(f"({sort_expr}, id) {'<' if desc else '>'} (?, ?)")
+        page_params += [sort_value, last_id]
+    page_sql = (" WHERE " + " AND ".join(page_where)) if page_where else ""
+    direction = "DESC" if desc else "ASC"
+    limit_sql = "LIMIT ?" if cursor else "LIMIT ? OFFSET ?"
+    page_params += [per_page] if cursor else [per_page, (page - 1) * per_page]
+
+    with get_db_connection() as con:
+        total = con.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+        filtered = con.execute(f"SELECT COUNT(*) FROM reminders{filter_sql}", params).fetchone()[0] if where else total
+        rows = con.execute(
+            f"SELECT * FROM reminders{page_sql} ORDER BY {sort_expr} {direction}, id {direction} {limit_sql}",
+            page_params
+        ).fetchall()
+
+    data = [r for r in (decorate_reminder(row, today) for row in rows) if r is not None]
+    next_cursor = encode_cursor(rows[-1][sort] or '', rows[-1]['id']) if len(rows) == per_page else None
+    return {"data": data, "total": total, "filtered": filtered, "page": page, "per_page": per_page, "next_cursor": next_cursor}
+
+# ----------------- SEARCH -----------------
+# Index FTS5 contentless atas reminders, disinkronkan trigger SQLite (add/edit/delete/import/clear ikut otomatis).
+# Kolom `compact` berisi plat & no_uji tanpa spasi/tanda baca + nomor HP tanpa 0/62 di depan,
+# supaya "AD1234XY" cocok dengan "AD 1234 XY" dan "0857..." cocok dengan "62857...".
+def _sql_compact(expr):
+    s = f"upper(COALESCE({expr}, ''))"
+    for ch in (" ", "-", ".", "/", "+", "(", ")"):
+        s = f"replace({s}, '{ch}', '')"
+    return s
+
+def _sql_phone_local(expr):
+    p = _sql_compact(expr)
+    return f"(CASE WHEN substr({p}, 1, 2) = '62' THEN substr({p}, 3) WHEN substr({p}, 1, 1) = '0' THEN substr({p}, 2) ELSE {p} END)"
+
+def _fts_values(alias):
+    return (f"{alias}.name, {alias}.vehicle_number, {alias}.no_uji, {alias}.phone, "
+            f"{_sql_compact(alias + '.vehicle_number')} || ' ' || {_sql_compact(alias + '.no_uji')} || ' ' || {_sql_phone_local(alias + '.phone')}")
+
+SEARCH_COLUMNS = "name, vehicle_number, no_uji, phone, compact"
+SEARCH_WEIGHTS = "2.0, 10.0, 10.0, 5.0, 8.0"  # bobot bm25 per kolom: plat & no_uji paling relevan
+_fts_enabled = False
+
+def init_search_index(con):
+    """Buat tabel FTS5 + trigger; isi dari reminders kalau tabel baru. SQLite tanpa FTS5 -> fallback LIKE."""
+    global _fts_enabled
+    exists = con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='reminders_fts'").fetchone() is not None
+    try:
+        con.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS reminders_fts USING fts5({SEARCH_COLUMNS}, "
+                    "content='', tokenize='unicode61 remove_diacritics 2')")
+    except sqlite3.OperationalError as e:
+        log_event(logging.WARNING, "FTS5 tidak tersedia, pencarian memakai LIKE", error=e)
+        _fts_enabled = False
+        return
+    con.execute(f"""CREATE TRIGGER IF NOT EXISTS reminders_fts_ai AFTER INSERT ON reminders BEGIN
+        INSERT INTO reminders_fts(rowid, {SEARCH_COLUMNS}) VALUES (new.id, {_fts_values('new')});
+    END""")
+    con.execute(f"""CREATE TRIGGER IF NOT EXISTS reminders_fts_ad AFTER DELETE ON reminders BEGIN
+        INSERT INTO reminders_fts(reminders_fts, rowid, {SEARCH_COLUMNS}) VALUES ('delete', old.id, {_fts_values('old')});
+    END""")
+    con.execute(f"""CREATE TRIGGER IF NOT EXISTS reminders_fts_au AFTER UPDATE ON reminders BEGIN
+        INSERT INTO reminders_fts(reminders_fts, rowid, {SEARCH_COLUMNS}) VALUES ('delete', old.id, {_fts_values('old')});
+        INSERT INTO reminders_fts(rowid, {SEARCH_COLUMNS}) VALUES (new.id, {_fts_values('new')});
+    END""")
+    if not exists:
+        rebuild_search_index(con)
+    _fts_enabled = True
+
+def rebuild_search_index(con=None):
+    """Isi ulang index pencarian dari tabel reminders (perbaikan manual: `manage.py reindex`)."""
+    with (con or get_db_connection()) as c:
+        c.execute("INSERT INTO reminders_fts(reminders_fts) VALUES ('delete-all')")
+        c.execute(f"INSERT INTO reminders_fts(rowid, {SEARCH_COLUMNS}) SELECT r.id, {_fts_values('r')} FROM reminders r")
+
+def build_fts_query(q):
+    """
+    Query FTS5 dari input bebas: semua kata sebagai prefix (AND), ATAU gabungan tanpa spasi di kolom compact.
+    Return None kalau tidak ada kata yang bisa dicari.
+    """
+    terms = re.findall(r"\w+", q or "")
+    if not terms:
+        return None
+    joined = "".join(terms).upper()
+    if joined.isdigit():
+        # angka saja: nomor HP lewat kolom compact; kata "62"/"0857" dsb. tidak di-AND-kan karena
+        # prefix "62"* cocok dengan hampir semua nomor. Satu kata angka tetap dicari sebagai angka plat/no uji.
+        local = normalize_phone(joined)
+        local = local[2:] if local.startswith("62") else local
+        phone_part = f'compact : "{local}"*'
+        return f'"{terms[0]}"* OR {phone_part}' if len(terms) == 1 else phone_part
+    return "(" + " AND ".join(f'"{t}"*' for t in terms) + f') OR compact : "{joined}"*'
+
+def search_filter_sql(q):
+    """Kondisi WHERE atas reminders untuk kata kunci q (FTS5 kalau ada, LIKE kalau tidak)."""
+    if _fts_enabled:
+        match = build_fts_query(q)
+        if match is None:
+            return None
+        return "id IN (SELECT rowid FROM reminders_fts WHERE reminders_fts MATCH ?)", [match]
+    like = f"%{q.strip()}%"
+    return "(name LIKE ? OR vehicle_number LIKE ? OR no_uji LIKE ? OR phone LIKE ?)", [like] * 4
+
+def search_reminders(q, page=1, per_page=25, status=None):
+    """Pencarian ber-ranking (bm25) + pagination. Return {data, total, page, per_page}."""
+    per_page = max(1, min(int(per_page), LIST_MAX_PER_PAGE))
+    page = max(1, int(page))
+    today = date.today()
+    match = build_fts_query(q) if _fts_enabled else None
+    if _fts_enabled and match is None:
+        return {"data": [], "total": 0, "page": page, "per_page": per_page}
+    where, params = [], []
+    if status and status != 'Semua Data':
+        clause, args = status_filter_sql(status, today)
+        where.append("r." + clause)
+        params += args
+    with get_db_connection() as con:
+        if _fts_enabled:
+            base = ("FROM reminders_fts f JOIN reminders r ON r.id = f.rowid WHERE reminders_fts MATCH ?"
+                    + "".join(" AND " + w for w in where))
+            base_params = [match] + params
+            order = f"bm25(reminders_fts, {SEARCH_WEIGHTS}), r.test_date, r.id"
+        else:
+            clause, args = search_filter_sql(q)
+            base = "FROM reminders r WHERE " + " AND ".join([clause] + where)
+            base_params = args + params
+            order = "r.test_date, r.id"
+        total = con.execute(f"SELECT COUNT(*) {base}", base_params).fetchone()[0]
+        rows = con.execute(f"SELECT r.* {base} ORDER BY {order} LIMIT ? OFFSET ?",
+                           base_params + [per_page, (page - 1) * per_page]).fetchall()
+    data = [r for r in (decorate_reminder(row, today) for row in rows) if r is not None]
+    return {"data": data, "total": total, "page": page, "per_page": per_page}
+
+def reminder_status_counts():
+    """
+    Jumlah reminder per status untuk kartu ringkasan, dihitung di SQL.
+    Kondisi diambil dari status_filter_sql supaya angka kartu = jumlah baris saat kartu diklik.
+    """
+    today = date.today()
+    statuses = ("Expired", "H (today)", "H-1", "H-2", "H-3 or more")
+    sums, params = [], []
+    for status in statuses:
+        cond, cond_params = status_filter_sql(status, today)
+        sums.append(f"SUM({cond})")
+        params.extend(cond_params)
+    with get_db_connection() as con:
+        row = con.execute(f"SELECT COUNT(*), {', '.join(sums)} FROM reminders", params).fetchone()
+    counts = {"total": row[0]}
+    counts.update((status, row[i + 1] or 0) for i, status in enumerate(statuses))
+    return counts
+
 def classify_by_days(days_until):
     if days_until == 0:
         return "H (today)", "danger"  # Merah
@@ -122,79 +1127,1548 @@ def normalize_phone(phone: str) -> str:
         return "62" + phone
     return phone
 
-def log_message(direction, phone, message_text, status="unknown", meta=None):
+def bump_message_rollups(con, created_at, direction, status, n=1):
+    """Tambah counter harian & bulanan. Dipanggil di transaksi yang sama dengan INSERT messages."""
+    status = status or "unknown"
+    con.execute(
+        "INSERT INTO message_counts_daily (day, direction, status, cnt) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(day, direction, status) DO UPDATE SET cnt = cnt + excluded.cnt",
+        (created_at[:10], direction, status, n)
+    )
+    con.execute(
+        "INSERT INTO message_counts_monthly (month, direction, status, cnt) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(month, direction, status) DO UPDATE SET cnt = cnt + excluded.cnt",
+        (created_at[:7], direction, status, n)
+    )
+
+def backfill_message_rollups(con=None):
+    """
+    Hitung ulang rollup dari tabel messages (one-off, juga dipakai untuk perbaikan manual).
+    Hari sebelum row messages tertua (sudah diarsipkan retention) dibiarkan apa adanya.
+    """
+    own = con is None
+    if own:
+        con = get_db_connection()
+    with con:
+        oldest = con.execute("SELECT MIN(created_at) FROM messages").fetchone()[0]
+        con.execute("DELETE FROM message_counts_daily WHERE day >= ?", ((oldest or "~")[:10],))
+        con.execute("DELETE FROM message_counts_monthly")
+        con.execute("""
+            INSERT INTO message_counts_daily (day, direction, status, cnt)
+            SELECT substr(created_at, 1, 10), direction, COALESCE(status, 'unknown'), COUNT(*)
+            FROM messages GROUP BY 1, 2, 3
+        """)
+        con.execute("""
+            INSERT INTO message_counts_monthly (month, direction, status, cnt)
+            SELECT substr(day, 1, 7), direction, status, SUM(cnt)
+            FROM message_counts_daily GROUP BY 1, 2, 3
+        """)
+    bump_data_version()
+
+def write_message_rows(rows):
+    """Insert banyak row messages + update rollup dalam satu transaksi."""
+    if not rows:
+        return
+    counts = Counter((r[5][:10], r[0], r[3] or "unknown") for r in rows)
+    with get_db_connection() as con:
+        con.executemany(
+            "INSERT INTO messages (direction, phone, message, status, meta, created_at, template_id, template_version, params) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        for (day, direction, status), n in counts.items():
+            bump_message_rollups(con, day, direction, status, n)
+    bump_data_version()
+    publish_message_counts(counts)
+
+class MessageLogWriter(threading.Thread):
+    """
+    Buffer log messages dan tulis per batch (satu transaksi, satu fsync) di background.
+    Row menunggu paling lama MESSAGE_LOG_FLUSH_SEC sebelum ditulis.
+    """
+
+    def __init__(self, flush_sec=None, batch_size=None):
+        super().__init__(name="message-log-writer", daemon=True)
+        self.flush_sec = MESSAGE_LOG_FLUSH_SEC if flush_sec is None else flush_sec
+        self.batch_size = MESSAGE_LOG_BATCH_SIZE if batch_size is None else batch_size
+        self.queue = queue.Queue()
+        self._stopping = threading.Event()
+
+    def submit(self, row):
+        self.queue.put(row)
+
+    def flush(self):
+        """Blok sampai semua row yang sudah di-submit tertulis."""
+        self.queue.join()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+    def run(self):
+        while not (self._stopping.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_sec)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_sec
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                write_message_rows(batch)
+            except Exception as e:
+                log_event(logging.ERROR, "gagal log message batch", rows=len(batch), error=e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        close_db_connection()
+
+_message_writer = None
+
+def start_message_writer():
+    global _message_writer
+    if _message_writer is None:
+        _message_writer = MessageLogWriter()
+        _message_writer.start()
+        atexit.register(stop_message_writer)
+    return _message_writer
+
+def stop_message_writer():
+    global _message_writer
+    if _message_writer is not None:
+        _message_writer.stop()
+        _message_writer = None
+
+def log_message(direction, phone, message, status="unknown", meta=None):
+    """message: teks biasa atau MessageRef; MessageRef disimpan ringkas (id template + params) tanpa render ulang."""
+    if isinstance(message, MessageRef) and MESSAGE_LOG_COMPACT:
+        row = (direction, phone, None, status, (meta or ""), datetime.utcnow().isoformat(),
+               message.template_id, message.version, params_json(message.params))
+    else:
+        row = (direction, phone, render_message(message), status, (meta or ""), datetime.utcnow().isoformat(),
+               None, None, None)
+    if _message_writer is not None:
+        _message_writer.submit(row)
+        return
     try:
+        write_message_rows([row])
+    except Exception as e:
+        log_event(logging.ERROR, "gagal log message", error=e)
+
+# ----------------- MESSAGE TEMPLATES -----------------
+# Registry template pesan: (template_id, versi) -> teks format. Log messages hanya menyimpan
+# id/versi + parameter, teks dirender ulang dari sini -> versi lama JANGAN diubah/dihapus,
+# tambahkan versi baru kalau isi pesan berubah.
+# Pesan reminder dibawa sebagai MessageRef sampai saat kirim; outbox & log menyimpan ref-nya saja.
+MessageRef = namedtuple("MessageRef", "template_id version params")
+
+MESSAGE_TEMPLATES = {
+    ("reminder", 1): (
+        "🚗 Halo Sdr/i {name} (sesuai STNK) \n\n"
+        "📅 Masa berlaku UJI KIR anda dengan Nomor Kendaraan: {vehicle_number} \n"
+        "🔢 Nomor Uji : {no_uji} \n"
+        "🚛 Jenis Kendaraan : {jenis_kendaraan} \n"
+        "📆 Tanggal Uji Kendaraan: {test_date}\n\n"
+        "⚠️ Mohon untuk segera melakukkan uji berkala kendaraan anda di Pengujian Kendaraan Bermotor di Dishub Kota Surakarta.\n"
+        "✅ Pastikan kendaraan anda sudah siap diuji dan layak jalan. \n"
+        "🔧 Pemilik wajib menjaga dan memelihara kendaraan agar selalu dalam kondisi baik dan layak jalan\n"
+        "⏰ Harap hadir sesuai jadwal \n\n"
+        "🙏 Terima Kasih - Dishub Kota Surakarta\n"
+    ),
+}
+LATEST_TEMPLATE_VERSION = {}
+for _tid, _ver in MESSAGE_TEMPLATES:
+    LATEST_TEMPLATE_VERSION[_tid] = max(_ver, LATEST_TEMPLATE_VERSION.get(_tid, 0))
+
+@functools.lru_cache(maxsize=None)
+def template_fields(template_id, version):
+    """Nama placeholder template sesuai urutan kemunculan (urutan params yang disimpan di log)."""
+    fields = []
+    for _, field, _, _ in string.Formatter().parse(MESSAGE_TEMPLATES[(template_id, version)]):
+        if field and field not in fields:
+            fields.append(field)
+    return tuple(fields)
+
+@functools.lru_cache(maxsize=None)
+def template_pattern(template_id, version):
+    """Regex kebalikan template, untuk mengenali teks yang dirender dari template ini."""
+    parts, seen = [], set()
+    for literal, field, _, _ in string.Formatter().parse(MESSAGE_TEMPLATES[(template_id, version)]):
+        parts.append(re.escape(literal))
+        if field:
+            parts.append(f"(?P={field})" if field in seen else f"(?P<{field}>.*?)")
+            seen.add(field)
+    return re.compile("".join(parts), re.DOTALL)
+
+def render_message_template(template_id, params, version=None):
+    """params: dict atau list sesuai template_fields. Tanpa versi -> versi terbaru."""
+    version = LATEST_TEMPLATE_VERSION[template_id] if version is None else version
+    fields = template_fields(template_id, version)
+    values = params if isinstance(params, dict) else dict(zip(fields, params))
+    return MESSAGE_TEMPLATES[(template_id, version)].format_map({f: values.get(f) for f in fields})
+
+def render_message(message):
+    """Teks pesan dari teks biasa atau MessageRef."""
+    if isinstance(message, MessageRef):
+        return render_message_template(message.template_id, message.params, message.version)
+    return message
+
+def params_json(params):
+    return json.dumps(params, ensure_ascii=False, separators=(",", ":"))
+
+def compact_message(text):
+    """
+    (template_id, versi, params) kalau text persis hasil render salah satu template, selain itu None.
+    Hanya untuk migrasi row lama (compact_message_log); pesan baru sudah membawa MessageRef.
+    """
+    if not text:
+        return None
+    for template_id, version in MESSAGE_TEMPLATES:
+        m = template_pattern(template_id, version).fullmatch(text)
+        if m:
+            params = [m.group(f) for f in template_fields(template_id, version)]
+            if render_message_template(template_id, params, version) == text:
+                return template_id, version, params
+    return None
+
+def compact_meta(resp):
+    """Buang field response gateway yang bisa diturunkan lagi (echo teks pesan, nomor tujuan, flag sukses)."""
+    if not isinstance(resp, dict):
+        return str(resp)
+    rest = {k: v for k, v in resp.items() if k not in ("message", "success", "to", "client_id")}
+    return json.dumps(rest, ensure_ascii=False) if rest else ""
+
+def message_ref(row):
+    """Pesan satu row messages/outbox: MessageRef kalau disimpan ringkas, selain itu teksnya."""
+    if row['message'] is not None or not row['template_id']:
+        return row['message']
+    return MessageRef(row['template_id'], row['template_version'], json.loads(row['params'] or "[]"))
+
+def message_text(row):
+    """Teks lengkap satu row messages/outbox, dirender ulang dari template kalau row disimpan ringkas."""
+    return render_message(message_ref(row))
+
+def compact_message_log(batch_size=5000):
+    """
+    Migrasi row messages lama (teks penuh) ke bentuk ringkas template + params.
+    Hanya row yang bisa dirender ulang persis sama yang diubah. Return {scanned, compacted}.
+    """
+    report = {"scanned": 0, "compacted": 0}
+    last_id = 0
+    while True:
         with get_db_connection() as con:
-            con.execute(
-                "INSERT INTO messages (direction, phone, message, status, meta, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (direction, phone, message_text, status, (meta or ""), datetime.utcnow().isoformat())
+            rows = con.execute(
+                "SELECT id, status, meta, message FROM messages WHERE id > ? AND direction='out' AND message IS NOT NULL "
+                "ORDER BY id LIMIT ?", (last_id, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                compact = compact_message(row['message'])
+                if not compact:
+                    continue
+                meta = row['meta']
+                if row['status'] == 'sent' and meta:
+                    try:
+                        meta = compact_meta(ast.literal_eval(meta))
+                    except (ValueError, SyntaxError):
+                        pass
+                template_id, version, params = compact
+                updates.append((template_id, version, params_json(params), meta, row['id']))
+            con.executemany(
+                "UPDATE messages SET message=NULL, template_id=?, template_version=?, params=?, meta=? WHERE id=?",
+                updates
             )
-    except Exception as e:
-        print("❌ Gagal log message:", e)
+        last_id = rows[-1]['id']
+        report["scanned"] += len(rows)
+        report["compacted"] += len(updates)
+    return report
 
 def build_message(record, status_label):
-    return (
-        f"🚗 Halo Sdr/i {record['name']} (sesuai STNK) \n\n"
-        f"📅 Masa berlaku UJI KIR anda dengan Nomor Kendaraan: {record['vehicle_number']} \n"
-        f"🔢 Nomor Uji : {record['no_uji']} \n"
-        f"🚛 Jenis Kendaraan : {record['jenis_kendaraan']} \n"
-        f"📆 Tanggal Uji Kendaraan: {record['test_date']}\n\n"
-        f"⚠️ Mohon untuk segera melakukkan uji berkala kendaraan anda di Pengujian Kendaraan Bermotor di Dishub Kota Surakarta.\n"
-        f"✅ Pastikan kendaraan anda sudah siap diuji dan layak jalan. \n"
-        f"🔧 Pemilik wajib menjaga dan memelihara kendaraan agar selalu dalam kondisi baik dan layak jalan\n"
-        f"⏰ Harap hadir sesuai jadwal \n\n"
-        f"🙏 Terima Kasih - Dishub Kota Surakarta\n"
+    """MessageRef template reminder terbaru; teks baru dirender saat dikirim."""
+    version = LATEST_TEMPLATE_VERSION["reminder"]
+    return MessageRef("reminder", version, [record.get(f) for f in template_fields("reminder", version)])
+
+# ----------------- BULK IMPORT / EXPORT -----------------
+# header spreadsheet -> kolom reminders (lowercase, spasi/titik jadi underscore)
+IMPORT_COLUMN_ALIASES = {
+    'name': 'name', 'nama': 'name', 'nama_pemilik': 'name',
+    'vehicle_number': 'vehicle_number', 'no_kendaraan': 'vehicle_number', 'nomor_kendaraan': 'vehicle_number',
+    'plat': 'vehicle_number', 'plat_nomor': 'vehicle_number', 'nopol': 'vehicle_number',
+    'no_uji': 'no_uji', 'nomor_uji': 'no_uji',
+    'jenis_kendaraan': 'jenis_kendaraan', 'jenis': 'jenis_kendaraan',
+    'test_date': 'test_date', 'tanggal_uji': 'test_date', 'tgl_uji': 'test_date',
+    'phone': 'phone', 'telepon': 'phone', 'no_hp': 'phone', 'hp': 'phone', 'no_wa': 'phone', 'whatsapp': 'phone',
+}
+IMPORT_REQUIRED = ('name', 'vehicle_number', 'no_uji', 'test_date')
+IMPORT_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d')
+EXPORT_COLUMNS = ('id', 'name', 'vehicle_number', 'no_uji', 'jenis_kendaraan', 'test_date', 'phone', 'status', 'created_at')
+
+def normalize_header(value):
+    key = str(value or '').strip().lower().replace('.', '').replace(' ', '_').replace('-', '_')
+    return IMPORT_COLUMN_ALIASES.get(key)
+
+def parse_import_date(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.isoformat()
+    raw = str(value or '').strip().split()[0] if str(value or '').strip() else ''
+    for fmt in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"test_date tidak valid: {value!r} (pakai YYYY-MM-DD)")
+
+def normalize_import_row(raw):
+    """Validasi & normalisasi satu row import. Raise ValueError kalau tidak valid."""
+    row = {k: (str(v).strip() if v is not None and not isinstance(v, (date, datetime)) else v) for k, v in raw.items()}
+    missing = [k for k in IMPORT_REQUIRED if not row.get(k)]
+    if missing:
+        raise ValueError(f"missing field {', '.join(missing)}")
+    phone = normalize_phone(str(row.get('phone') or ''))
+    if phone and not (phone.isdigit() and 9 <= len(phone) <= 15):
+        raise ValueError(f"phone tidak valid: {row.get('phone')!r}")
+    return {
+        'name': row['name'],
+        'vehicle_number': row['vehicle_number'],
+        'no_uji': row['no_uji'],
+        'jenis_kendaraan': row.get('jenis_kendaraan') or None,
+        'test_date': parse_import_date(row['test_date']),
+        'phone': phone or None,
+    }
+
+def _iter_csv_rows(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='') if not isinstance(stream, io.TextIOBase) else stream
+    first = text.readline()
+    if not first:
+        return
+    try:
+        dialect = csv.Sniffer().sniff(first, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(itertools.chain([first], text), dialect)
+
+def _iter_xlsx_rows(stream):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Import XLSX butuh paket openpyxl (pip install openpyxl)")
+    wb = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for values in wb.active.iter_rows(values_only=True):
+            yield list(values)
+    finally:
+        wb.close()
+
+def iter_import_rows(stream, filename):
+    """Yield (row_number, dict) dari file CSV/XLSX secara streaming; row_number mengikuti baris di file."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        rows = _iter_xlsx_rows(stream)
+    elif ext in ('.csv', '.txt', ''):
+        rows = _iter_csv_rows(stream)
+    else:
+        raise ValueError(f"format file tidak didukung: {ext} (pakai .csv atau .xlsx)")
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = [normalize_header(h) for h in header]
+    if not set(IMPORT_REQUIRED) <= set(columns):
+        missing = sorted(set(IMPORT_REQUIRED) - set(columns))
+        raise ValueError(f"kolom wajib tidak ada di header: {', '.join(missing)}")
+    for number, values in enumerate(rows, start=2):
+        if not any(v not in (None, '') for v in values):
+            continue  # baris kosong
+        yield number, {col: val for col, val in zip(columns, values) if col}
+
+_no_uji_unique = False
+
+def init_no_uji_index(con):
+    """
+    Index UNIQUE no_uji (NULL boleh lebih dari satu) supaya import bisa upsert atomik lewat ON CONFLICT.
+    DB lama yang sudah berisi no_uji ganda tetap memakai index biasa sampai dibereskan manual.
+    """
+    global _no_uji_unique
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_reminders_no_uji_unique'").fetchone():
+        _no_uji_unique = True
+        return
+    con.execute("UPDATE reminders SET no_uji=NULL WHERE no_uji=''")
+    dupes = con.execute(
+        "SELECT COUNT(*) FROM (SELECT 1 FROM reminders WHERE no_uji IS NOT NULL GROUP BY no_uji HAVING COUNT(*) > 1)"
+    ).fetchone()[0]
+    if dupes:
+        log_event(logging.WARNING, "no_uji ganda, index unik tidak dibuat; import memakai select lalu update/insert",
+                  duplicates=dupes)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_reminders_no_uji ON reminders(no_uji)")
+        _no_uji_unique = False
+        return
+    con.execute("CREATE UNIQUE INDEX idx_reminders_no_uji_unique ON reminders(no_uji)")
+    con.execute("DROP INDEX IF EXISTS idx_reminders_no_uji")  # digantikan index unik
+    _no_uji_unique = True
+
+def upsert_reminders_chunk(con, records):
+    """Upsert berdasarkan no_uji: update yang sudah ada, insert sisanya. Return (inserted, updated)."""
+    by_no_uji = {}
+    for rec in records:
+        by_no_uji[rec['no_uji']] = rec  # row terakhir di file menang
+    keys = list(by_no_uji)
+    fields = ('name', 'vehicle_number', 'jenis_kendaraan', 'test_date', 'phone')
+    now_iso = datetime.utcnow().isoformat()
+    if _no_uji_unique:
+        # satu statement per row, tanpa jeda antara cek dan tulis; row baru dihitung dari id > max(id) sebelumnya
+        last_id = con.execute("SELECT COALESCE(MAX(id), 0) FROM reminders").fetchone()[0]
+        con.executemany(
+            "INSERT INTO reminders (name, vehicle_number, jenis_kendaraan, test_date, phone, no_uji, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(no_uji) DO UPDATE SET name=excluded.name, "
+            "vehicle_number=excluded.vehicle_number, jenis_kendaraan=excluded.jenis_kendaraan, "
+            "test_date=excluded.test_date, phone=excluded.phone",
+            [tuple(by_no_uji[k][f] for f in fields) + (k, now_iso) for k in keys]
+        )
+        inserted = con.execute("SELECT COUNT(*) FROM reminders WHERE id > ? AND created_at = ?",
+                               (last_id, now_iso)).fetchone()[0]
+        return inserted, len(keys) - inserted
+    existing = set()
+    for i in range(0, len(keys), 500):  # batas jumlah parameter SQLite
+        part = keys[i:i + 500]
+        rows = con.execute(
+            f"SELECT no_uji FROM reminders WHERE no_uji IN ({', '.join('?' * len(part))})", part
+        ).fetchall()
+        existing.update(r[0] for r in rows)
+    updates = [tuple(by_no_uji[k][f] for f in fields) + (k,) for k in keys if k in existing]
+    inserts = [tuple(by_no_uji[k][f] for f in fields) + (k, now_iso) for k in keys if k not in existing]
+    con.executemany(
+        "UPDATE reminders SET name=?, vehicle_number=?, jenis_kendaraan=?, test_date=?, phone=? WHERE no_uji=?",
+        updates
+    )
+    con.executemany(
+        "INSERT INTO reminders (name, vehicle_number, jenis_kendaraan, test_date, phone, no_uji, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        inserts
     )
+    return len(inserts), len(updates)
+
+def import_reminders(stream, filename, chunk_size=None, dry_run=False):
+    """
+    Import reminders dari CSV/XLSX secara streaming per chunk (satu transaksi per chunk).
+    Return laporan {total, inserted, updated, failed, errors: [{row, error}]}.
+    """
+    chunk_size = IMPORT_CHUNK_SIZE if chunk_size is None else chunk_size
+    report = {"total": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": [], "dry_run": dry_run}
+    chunk = []
+
+    def flush():
+        if not chunk:
+            return
+        if not dry_run:
+            with get_db_connection() as con:
+                inserted, updated = upsert_reminders_chunk(con, chunk)
+            bump_data_version()
+            report["inserted"] += inserted
+            report["updated"] += updated
+        chunk.clear()
+
+    for number, raw in iter_import_rows(stream, filename):
+        report["total"] += 1
+        try:
+            chunk.append(normalize_import_row(raw))
+        except ValueError as e:
+            report["failed"] += 1
+            if len(report["errors"]) < IMPORT_MAX_ERRORS:
+                report["errors"].append({"row": number, "error": str(e)})
+            continue
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    if not dry_run and (report["inserted"] or report["updated"]):
+        if _scheduler is not None:
+            _scheduler.load_window()
+        publish_event("reminders.imported", inserted=report["inserted"], updated=report["updated"])
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    return report
+
+def iter_export_csv(status=None, q=None, batch_size=1000):
+    """Generator baris CSV reminders; baca per batch lewat cursor supaya tabel tidak dimuat penuh."""
+    where, params = [], []
+    today = date.today()
+    if status and status != 'Semua Data':
+        clause, args = status_filter_sql(status, today)
+        where.append(clause)
+        params += args
+    search = search_filter_sql(q) if q else None
+    if search:
+        where.append(search[0])
+        params += search[1]
+    sql = "SELECT * FROM reminders" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY test_date, id"
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+
+    def drain():
+        chunk = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        return chunk
 
-def send_whatsapp_message(phone, message_text):
-    """Kirim ke Node API. Return dict berisi status dan info. Juga log ke DB messages."""
+    writer.writerow(EXPORT_COLUMNS)
+    yield drain()
+    cur = get_db_connection().execute(sql, params)
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        for row in rows:
+            r = decorate_reminder(row, today) or dict(row)
+            writer.writerow([r.get(c, '') for c in EXPORT_COLUMNS])
+        yield drain()
+
+# ----------------- INBOUND -----------------
+def jid_to_phone(jid):
+    """'6281234@s.whatsapp.net' / '6281234:12@s.whatsapp.net' -> '6281234'."""
+    return normalize_phone(str(jid or "").split("@")[0].split(":")[0])
+
+def phone_variants(phone_norm):
+    """Bentuk nomor yang mungkin tersimpan di reminders.phone untuk satu nomor 62xxx."""
+    if not phone_norm.startswith("62"):
+        return [phone_norm]
+    local = phone_norm[2:]
+    return [phone_norm, "+" + phone_norm, "0" + local, local]
+
+def link_phones_to_reminders(con, phones):
+    """Map nomor ternormalisasi -> id reminder; kalau ada beberapa, pilih test_date terdekat yang belum lewat."""
+    variants = {}
+    for p in set(phones):
+        for v in phone_variants(p):
+            variants[v] = p
+    candidates = {}
+    keys = list(variants)
+    for i in range(0, len(keys), 500):
+        part = keys[i:i + 500]
+        rows = con.execute(
+            f"SELECT id, phone, test_date FROM reminders WHERE phone IN ({','.join('?' * len(part))})", part
+        ).fetchall()
+        for row in rows:
+            candidates.setdefault(variants[row['phone']], []).append((row['test_date'], row['id']))
+    today = date.today().isoformat()
+    linked = {}
+    for p, cands in candidates.items():
+        upcoming = [c for c in cands if c[0] >= today]
+        linked[p] = min(upcoming)[1] if upcoming else max(cands)[1]
+    return linked
+
+def ingest_inbound_messages(items):
+    """
+    Simpan batch pesan masuk dari bot dalam satu transaksi.
+    items: list dict {id, from, text, timestamp, push_name}. Duplikat (id WhatsApp sama) dilewati.
+    """
+    report = {"received": len(items), "inserted": 0, "duplicates": 0, "linked": 0, "invalid": 0}
+    rows = []
+    for item in items:
+        wa_id = str(item.get("id") or "").strip()
+        phone = jid_to_phone(item.get("from"))
+        if not wa_id or not phone:
+            report["invalid"] += 1
+            continue
+        try:
+            created_at = datetime.utcfromtimestamp(float(item["timestamp"])).isoformat()
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):  # timestamp di luar jangkauan mis. 1e20
+            created_at = datetime.utcnow().isoformat()
+        meta = json.dumps({"push_name": item["push_name"]}) if item.get("push_name") else ""
+        rows.append((wa_id, phone, item.get("text") or "", meta, created_at))
+    if not rows:
+        return report
+
+    counts = Counter()
+    with get_db_connection() as con:
+        links = link_phones_to_reminders(con, [r[1] for r in rows])
+        for wa_id, phone, text, meta, created_at in rows:
+            cur = con.execute(
+                "INSERT OR IGNORE INTO messages (direction, phone, message, status, meta, created_at, wa_message_id, reminder_id) "
+                "VALUES ('in', ?, ?, 'received', ?, ?, ?, ?)",
+                (phone, text, meta, created_at, wa_id, links.get(phone))
+            )
+            if cur.rowcount:
+                report["inserted"] += 1
+                report["linked"] += phone in links
+                counts[(created_at[:10], "in", "received")] += 1
+        for (day, direction, status), n in counts.items():
+            bump_message_rollups(con, day, direction, status, n)
+    report["duplicates"] = len(rows) - report["inserted"]
+    if report["inserted"]:
+        bump_data_version()
+        publish_message_counts(counts)
+    return report
+
+# ----------------- RETENTION -----------------
+def archive_file_path(archive_dir, month, first_id, last_id):
+    # nama berdasarkan rentang id: rerun setelah crash menulis ulang file yang sama, bukan duplikat
+    return os.path.join(archive_dir, month[:4], f"messages-{month}-{first_id}-{last_id}.jsonl.gz")
+
+def write_archive_file(archive_dir, month, rows):
+    """Tulis rows (streaming) ke file gzip JSON lines. Return (path, list id yang ditulis)."""
+    os.makedirs(os.path.join(archive_dir, month[:4]), exist_ok=True)
+    tmp = os.path.join(archive_dir, month[:4], f".messages-{month}.tmp")
+    ids = []
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for row in rows:
+                gz.write((json.dumps(dict(row), ensure_ascii=False) + "\n").encode("utf-8"))
+                ids.append(row['id'])
+        raw.flush()
+        os.fsync(raw.fileno())
+    if not ids:
+        os.remove(tmp)
+        return None, ids
+    path = archive_file_path(archive_dir, month, ids[0], ids[-1])
+    os.replace(tmp, path)
+    return path, ids
+
+def iter_archived_messages(path):
+    """Baca kembali satu file arsip (list dict per row)."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def ensure_incremental_vacuum(con):
+    """Ubah DB lama ke auto_vacuum=INCREMENTAL (butuh satu kali VACUUM penuh). Return True kalau dikonversi."""
+    if con.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    con.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    con.execute("VACUUM")
+    return True
+
+def run_retention(days=None, archive_dir=None, dry_run=False):
+    """
+    Pindahkan row messages yang lebih tua dari hot window ke arsip gzip per bulan lalu hapus dari DB,
+    hapus job outbox sent/dead yang sudah lewat window, lalu incremental vacuum.
+    Rollup harian/bulanan tidak disentuh sehingga /api/stats & timeseries tetap utuh.
+    """
+    days = MESSAGE_RETENTION_DAYS if days is None else days
+    archive_dir = ARCHIVE_DIR if archive_dir is None else archive_dir
+    cutoff = (datetime.utcnow() - timedelta(days=days)).date().isoformat()
+    report = {"cutoff": cutoff, "archived": 0, "months": {}, "files": [], "outbox_pruned": 0}
+    con = get_db_connection()
+    months = [r[0] for r in con.execute(
+        "SELECT DISTINCT substr(created_at, 1, 7) FROM messages WHERE created_at < ? ORDER BY 1", (cutoff,)
+    )]
+    for month in months:
+        month_range = (month, month + "~", cutoff)
+        if dry_run:
+            n = con.execute(
+                "SELECT COUNT(*) FROM messages WHERE created_at >= ? AND created_at < ? AND created_at < ?", month_range
+            ).fetchone()[0]
+        else:
+            rows = con.execute(
+                "SELECT * FROM messages WHERE created_at >= ? AND created_at < ? AND created_at < ? ORDER BY id", month_range
+            )
+            path, ids = write_archive_file(archive_dir, month, rows)
+            n = len(ids)
+            if path:
+                # hapus hanya id yang sudah masuk file arsip
+                with con:
+                    con.executemany("DELETE FROM messages WHERE id=?", ((i,) for i in ids))
+                report["files"].append(path)
+                log_event(logging.INFO, "messages diarsipkan", month=month, rows=n, path=path)
+        report["months"][month] = n
+        report["archived"] += n
+
+    if dry_run:
+        report["outbox_pruned"] = con.execute(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('sent', 'unconfirmed', 'dead') AND updated_at < ?", (cutoff,)
+        ).fetchone()[0]
+        return report
+    with con:
+        report["outbox_pruned"] = con.execute(
+            "DELETE FROM outbox WHERE status IN ('sent', 'unconfirmed', 'dead') AND updated_at < ?", (cutoff,)
+        ).rowcount
+    report["vacuum_converted"] = ensure_incremental_vacuum(con)
+    freed = con.execute("PRAGMA freelist_count").fetchone()[0]
+    con.execute("PRAGMA incremental_vacuum").fetchall()  # satu page per step, harus di-fetch sampai habis
+    report["pages_freed"] = freed - con.execute("PRAGMA freelist_count").fetchone()[0]
+    if report["archived"]:
+        bump_data_version()
+    return report
+
+# ----------------- DISPATCH -----------------
+class TokenBucket:
+    """Rate limiter sederhana: `rate` token per detik, maksimal `capacity` token tersimpan."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blok sampai satu token tersedia. rate <= 0 berarti tanpa batas."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Session keep-alive yang dipakai bersama semua worker (pool koneksi ke Node API)."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, SEND_CONCURRENCY))
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _http_session = session
+    return _http_session
+
+class CircuitBreaker:
+    """
+    Circuit breaker untuk Node API.
+    closed    -> kirim normal; `threshold` kegagalan beruntun (503/timeout/koneksi) membuka circuit.
+    open      -> kirim langsung ditunda (deferred) tanpa menunggu timeout; setelah `cooldown`
+                 detik endpoint status bot di-probe.
+    half_open -> probe sehat, satu kiriman percobaan diizinkan; sukses menutup circuit, gagal membuka lagi.
+    """
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, threshold=None, cooldown=None, status_url=None):
+        self.threshold = GATEWAY_BREAKER_THRESHOLD if threshold is None else threshold
+        self.cooldown = GATEWAY_BREAKER_COOLDOWN_SEC if cooldown is None else cooldown
+        self.status_url = NODE_STATUS_URL if status_url is None else status_url
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def retry_at(self):
+        """Waktu (unix) paling cepat kiriman berikutnya layak dicoba."""
+        with self.lock:
+            return self.opened_at + self.cooldown if self.state == "open" else time.time()
+
+    def is_open(self):
+        """True kalau circuit terbuka dan cooldown belum lewat (tanpa probe)."""
+        with self.lock:
+            return self.state == "open" and time.time() < self.opened_at + self.cooldown
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "half_open":
+                if self.trial_in_flight:
+                    return False
+                self.trial_in_flight = True
+                return True
+            if time.time() < self.opened_at + self.cooldown:
+                return False
+            self.opened_at = time.time()  # satu thread saja yang mem-probe per cooldown
+        healthy = self.probe()
+        with self.lock:
+            if not healthy:
+                self.opened_at = time.time()
+                return False
+            if self.state == "open":
+                self._transition("half_open")
+            if self.trial_in_flight:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    def probe(self):
+        """Cek endpoint status bot (ringan, timeout pendek). Sehat = 200 dan connected=true."""
+        started = time.perf_counter()
+        try:
+            r = get_http_session().get(self.status_url, timeout=GATEWAY_PROBE_TIMEOUT_SEC)
+            healthy = r.status_code == 200 and bool(r.json().get("connected"))
+            record_gateway_call("status", "healthy" if healthy else "unhealthy", r.status_code,
+                                time.perf_counter() - started)
+        except Exception as e:
+            record_gateway_call("status", "error", type(e).__name__, time.perf_counter() - started)
+            healthy = False
+        log_event(logging.DEBUG, "gateway probe", url=self.status_url, healthy=healthy)
+        return healthy
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial_in_flight = False
+            if self.state != "closed":
+                self._transition("closed")
+
+    def record_failure(self, reason):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                self.opened_at = time.time()
+                self._transition("open", reason=reason)
+
+    def _transition(self, state, **fields):
+        self.state = state
+        level = logging.WARNING if state == "open" else logging.INFO
+        log_event(level, "gateway circuit " + state.replace("_", "-"), failures=self.failures, **fields)
+
+    def deferred(self):
+        if METRICS_ENABLED:
+            GATEWAY_CALLS.inc(endpoint="send", outcome="deferred", code="circuit_open")
+        return {"status": "deferred", "error": "gateway circuit open", "retry_at": self.retry_at()}
+
+gateway_breaker = CircuitBreaker()
+GATEWAY_BREAKER_STATE = GaugeMetric(
+    "gateway_circuit_state", "Status circuit breaker Node API (0=closed, 1=half-open, 2=open)",
+    func=lambda: CircuitBreaker.STATES[gateway_breaker.state]
+)
+
+def dispatch_messages(jobs, concurrency=None, rate_per_sec=None, batch_size=None, on_result=None):
+    """
+    Kirim banyak pesan. Default per chunk GATEWAY_BATCH_SIZE lewat /send-batch (pacing oleh bot);
+    batch_size <= 1 atau bot tanpa /send-batch -> worker pool ke /send dengan rate limit.
+    jobs: list of (phone, message) dengan message teks atau MessageRef. Return list send_result dengan urutan sama seperti jobs.
+    on_result(index, send_result) dipanggil begitu tiap pesan selesai (untuk progress).
+    """
+    concurrency = SEND_CONCURRENCY if concurrency is None else concurrency
+    rate_per_sec = SEND_RATE_PER_SEC if rate_per_sec is None else rate_per_sec
+    batch_size = GATEWAY_BATCH_SIZE if batch_size is None else batch_size
+    if not jobs:
+        return []
+    if batch_size > 1 and len(jobs) > 1 and _batch_supported:
+        results = []
+        for start in range(0, len(jobs), batch_size):
+            chunk_results = send_whatsapp_batch(jobs[start:start + batch_size]) if _batch_supported else None
+            if chunk_results is None:
+                rest_cb = (lambda i, res, offset=start: on_result(offset + i, res)) if on_result else None
+                return results + dispatch_messages(jobs[start:], concurrency, rate_per_sec, batch_size=0, on_result=rest_cb)
+            if on_result:
+                for i, res in enumerate(chunk_results):
+                    on_result(start + i, res)
+            results.extend(chunk_results)
+        return results
+    bucket = TokenBucket(rate_per_sec)
+
+    def _send(job):
+        phone, message = job
+        if gateway_breaker.is_open():
+            return gateway_breaker.deferred()  # tidak perlu menunggu token / timeout
+        bucket.acquire()
+        return send_whatsapp_message(phone, message)
+
+    def _send_indexed(indexed_job):
+        index, job = indexed_job
+        result = _send(job)
+        if on_result:
+            on_result(index, result)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(jobs)))) as pool:
+        return list(pool.map(_send_indexed, enumerate(jobs)))
+
+def record_gateway_call(endpoint, outcome, code, seconds):
+    if METRICS_ENABLED:
+        GATEWAY_LATENCY.observe(seconds, endpoint=endpoint, outcome=outcome)
+        GATEWAY_CALLS.inc(endpoint=endpoint, outcome=outcome, code=code)
+
+def send_whatsapp_message(phone, message):
+    """Kirim ke Node API (message: teks atau MessageRef). Return dict berisi status dan info. Juga log ke DB messages."""
     phone_norm = normalize_phone(phone)
+    text = render_message(message)
+    if not gateway_breaker.allow():
+        return gateway_breaker.deferred()
+    started = time.perf_counter()
     try:
-        payload = {"phone": phone_norm, "message": message_text}
-        print(f"📤 Sending to Node API {NODE_API} payload={payload}")
-        r = requests.post(NODE_API, json=payload, timeout=10)
-        print("📥 Response:", r.status_code, r.text)
+        payload = {"phone": phone_norm, "message": text}
+        log_event(logging.DEBUG, "gateway send", url=NODE_API, phone=phone_norm, size=len(text))
+        r = get_http_session().post(NODE_API, json=payload, timeout=GATEWAY_TIMEOUT_SEC,
+                                    headers=gateway_wait_header(GATEWAY_TIMEOUT_SEC))
+        if r.status_code == 429:
+            record_gateway_call("send", "deferred", r.status_code, time.perf_counter() - started)
+            gateway_breaker.record_success()
+            return gateway_queue_full(r)
+        outcome = "sent" if r.status_code == 200 else "failed"
+        record_gateway_call("send", outcome, r.status_code, time.perf_counter() - started)
+        # 503 = bot belum/tidak terkoneksi ke WhatsApp; error lain (mis. nomor invalid) bukan gangguan gateway
+        if r.status_code == 503:
+            gateway_breaker.record_failure("http_503")
+        else:
+            gateway_breaker.record_success()
+        log_event(logging.DEBUG, "gateway response", phone=phone_norm, code=r.status_code, body=r.text)
         try:
             resp_json = r.json()
         except Exception:
             resp_json = {"raw_text": r.text}
         if r.status_code == 200:
             result = {"status": "sent via Node API", "response": resp_json}
-            log_message("out", phone_norm, message_text, status="sent", meta=str(resp_json))
+            log_message("out", phone_norm, message, status="sent", meta=compact_meta(resp_json))
             return result
         else:
-            log_message("out", phone_norm, message_text, status="failed", meta=str(resp_json))
+            log_message("out", phone_norm, message, status="failed", meta=str(resp_json))
             return {"status": "failed", "error": resp_json}
+    except requests.ReadTimeout as e:
+        # request sudah diterima bot (koneksi & body terkirim) -> hasil tidak diketahui, bukan kegagalan gateway
+        record_gateway_call("send", "unconfirmed", type(e).__name__, time.perf_counter() - started)
+        log_event(logging.WARNING, "gateway read timeout, hasil kirim tidak diketahui", phone=phone_norm, error=e)
+        log_message("out", phone_norm, message, status="unconfirmed", meta=str(e))
+        return {"status": "unconfirmed", "error": f"read timeout: {e}"}
     except Exception as e:
-        print("❌ Exception:", str(e))
-        log_message("out", phone_norm, message_text, status="error", meta=str(e))
+        record_gateway_call("send", "error", type(e).__name__, time.perf_counter() - started)
+        if isinstance(e, (requests.Timeout, requests.ConnectionError)):
+            gateway_breaker.record_failure(type(e).__name__)
+        else:
+            gateway_breaker.record_success()
+        log_event(logging.WARNING, "gateway error", phone=phone_norm, error=e)
+        log_message("out", phone_norm, message, status="error", meta=str(e))
         return {"status": "error", "error": str(e)}
 
-def run_now_check(as_of_date=None):
-    today = date.today() if as_of_date is None else datetime.strptime(as_of_date, '%Y-%m-%d').date()
-    results = list_reminders()
-    actions = []
-    for r in results:
+def gateway_wait_header(read_timeout):
+    """
+    Batas tunggu antrian untuk bot: request yang tidak akan selesai sebelum read timeout kita
+    ditolak bot dengan 429 sebelum masuk antrian (20% disisakan untuk latency jaringan/socket).
+    """
+    return {"X-Max-Wait-Ms": str(int(read_timeout * 800))}
+
+def gateway_queue_full(r):
+    """Hasil 'deferred' untuk 429 antrian bot penuh; outbox menunda tanpa menghitung percobaan."""
+    try:
+        retry_after = float(r.headers.get("Retry-After") or 1)
+    except ValueError:
+        retry_after = 1
+    log_event(logging.INFO, "antrian gateway penuh, kirim ditunda", retry_after=retry_after)
+    return {"status": "deferred", "error": "gateway queue full", "retry_at": time.time() + retry_after}
+
+_batch_supported = True  # False setelah bot menjawab 404 untuk /send-batch (versi lama)
+
+def send_whatsapp_batch(items):
+    """
+    Kirim banyak pesan dalam satu request ke /send-batch; jeda antar pesan diatur bot.
+    items: list of (phone, message) dengan message teks atau MessageRef. Return list send_result (format sama dengan send_whatsapp_message),
+    atau None kalau bot belum punya /send-batch sehingga pemanggil harus kirim satu-satu.
+    """
+    global _batch_supported
+    phones = [normalize_phone(phone) for phone, _ in items]
+    messages = [message for _, message in items]
+    texts = [render_message(message) for message in messages]
+    if not gateway_breaker.allow():
+        return [gateway_breaker.deferred() for _ in items]
+    payload = {"items": [{"phone": p, "message": t, "client_id": str(i)} for i, (p, t) in enumerate(zip(phones, texts))]}
+    log_event(logging.DEBUG, "gateway send batch", url=NODE_BATCH_API, size=len(items))
+    started = time.perf_counter()
+    try:
+        r = get_http_session().post(NODE_BATCH_API, json=payload, timeout=(GATEWAY_TIMEOUT_SEC, GATEWAY_BATCH_TIMEOUT_SEC),
+                                    headers=gateway_wait_header(GATEWAY_BATCH_TIMEOUT_SEC))
+    except requests.ReadTimeout as e:
+        # batch sudah diterima bot; mengulang bisa mengirim dua kali -> tandai unconfirmed
+        record_gateway_call("send_batch", "unconfirmed", type(e).__name__, time.perf_counter() - started)
+        log_event(logging.WARNING, "gateway batch read timeout, hasil kirim tidak diketahui", size=len(items), error=e)
+        for p, m in zip(phones, messages):
+            log_message("out", p, m, status="unconfirmed", meta=str(e))
+        return [{"status": "unconfirmed", "error": f"read timeout: {e}"} for _ in items]
+    except Exception as e:
+        record_gateway_call("send_batch", "error", type(e).__name__, time.perf_counter() - started)
+        if isinstance(e, (requests.Timeout, requests.ConnectionError)):
+            gateway_breaker.record_failure(type(e).__name__)
+        else:
+            gateway_breaker.record_success()
+        log_event(logging.WARNING, "gateway batch error", size=len(items), error=e)
+        for p, m in zip(phones, messages):
+            log_message("out", p, m, status="error", meta=str(e))
+        return [{"status": "error", "error": str(e)} for _ in items]
+
+    if r.status_code == 429:
+        record_gateway_call("send_batch", "deferred", r.status_code, time.perf_counter() - started)
+        gateway_breaker.record_success()
+        result = gateway_queue_full(r)
+        return [dict(result) for _ in items]
+    record_gateway_call("send_batch", "sent" if r.status_code == 200 else "failed", r.status_code,
+                        time.perf_counter() - started)
+    if r.status_code == 404:
+        gateway_breaker.record_success()
+        _batch_supported = False
+        log_event(logging.WARNING, "gateway tidak mendukung /send-batch, kirim satu-satu", url=NODE_BATCH_API)
+        return None
+    try:
+        body = r.json()
+    except Exception:
+        body = {"raw_text": r.text}
+    if r.status_code != 200:
+        if r.status_code == 503:
+            gateway_breaker.record_failure("http_503")
+        else:
+            gateway_breaker.record_success()
+        for p, m in zip(phones, messages):
+            log_message("out", p, m, status="failed", meta=str(body))
+        return [{"status": "failed", "error": body} for _ in items]
+
+    by_id = {str(item.get("client_id")): item for item in body.get("results", [])}
+    results = []
+    for i, (p, m) in enumerate(zip(phones, messages)):
+        item = by_id.get(str(i)) or {"success": False, "error": "tidak ada hasil dari gateway"}
+        if item.get("success"):
+            results.append({"status": "sent via Node API", "response": item})
+            log_message("out", p, m, status="sent", meta=compact_meta(item))
+        else:
+            results.append({"status": "failed", "error": item})
+            log_message("out", p, m, status="failed", meta=str(item))
+    # 503 per item = koneksi WA putus di tengah batch
+    if not any(_is_sent(res) for res in results) and any(by_id.get(str(i), {}).get("status") == 503 for i in range(len(items))):
+        gateway_breaker.record_failure("http_503")
+    else:
+        gateway_breaker.record_success()
+    return results
+
+def send_progress_publisher(run_id, reminder_ids):
+    """Callback on_result untuk dispatch_messages: publish 'send.started' lalu 'send.progress' per pesan."""
+    total = len(reminder_ids)
+    done = itertools.count(1)
+    if total:
+        publish_event("send.started", run=run_id, total=total)
+
+    def on_result(index, send_result):
+        publish_event("send.progress", run=run_id, done=next(done), total=total,
+                      reminder_id=reminder_ids[index], status=send_result.get('status'))
+    return on_result
+
+# ----------------- OUTBOX -----------------
+def make_idempotency_key(reminder_id, test_date, stage):
+    return f"{reminder_id}:{test_date}:{stage}"
+
+def enqueue_message(reminder_id, test_date, stage, phone, message, claim=False, reopen_dead=False):
+    """
+    Masukkan pesan ke outbox. Return (job_id, created).
+    message MessageRef disimpan sebagai template_id/versi/params (dirender saat dikirim), teks biasa apa adanya.
+    created=False berarti key (reminder_id, test_date, stage) sudah pernah di-enqueue -> tidak dikirim ulang.
+    claim=True langsung menandai job 'sending' supaya dikirim oleh pemanggil, bukan worker.
+    reopen_dead=True: job lama yang sudah 'dead' diulang dari awal (dianggap created) dengan isi pesan baru.
+    """
+    key = make_idempotency_key(reminder_id, test_date, stage)
+    now_iso = datetime.utcnow().isoformat()
+    if isinstance(message, MessageRef):
+        content = (None, message.template_id, message.version, params_json(message.params))
+    else:
+        content = (message, None, None, None)
+    with get_db_connection() as con:
+        cur = con.execute(
+            "INSERT OR IGNORE INTO outbox (idempotency_key, reminder_id, stage, phone, message, template_id, template_version, params, "
+            "status, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, reminder_id, stage, phone, *content, 'sending' if claim else 'pending', time.time(), now_iso, now_iso)
+        )
+        if cur.rowcount:
+            job_id, created = cur.lastrowid, True
+        else:
+            job_id, created = con.execute("SELECT id FROM outbox WHERE idempotency_key=?", (key,)).fetchone()[0], False
+            if reopen_dead:
+                created = con.execute(
+                    "UPDATE outbox SET phone=?, message=?, template_id=?, template_version=?, params=?, status=?, attempts=0, "
+                    "next_attempt_at=?, last_error=NULL, updated_at=? WHERE id=? AND status='dead'",
+                    (phone, *content, 'sending' if claim else 'pending', time.time(), now_iso, job_id)
+                ).rowcount > 0
+    if created and not claim and _outbox_worker is not None:
+        _outbox_worker.wake()
+    return job_id, created
+
+def get_outbox_job(job_id):
+    with get_db_connection() as con:
+        row = con.execute("SELECT * FROM outbox WHERE id=?", (job_id,)).fetchone()
+    if not row:
+        return None
+    job = dict(row)
+    job['message'] = message_text(row)
+    return job
+
+def _is_sent(send_result):
+    return str(send_result.get('status', '')).startswith('sent')
+
+def complete_outbox_job(job_id, send_result):
+    """Catat hasil kirim. Gagal -> dijadwalkan ulang dengan exponential backoff sampai OUTBOX_MAX_ATTEMPTS."""
+    now_iso = datetime.utcnow().isoformat()
+    with get_db_connection() as con:
+        if _is_sent(send_result):
+            con.execute(
+                "UPDATE outbox SET status='sent', attempts=attempts+1, last_error=NULL, updated_at=? WHERE id=?",
+                (now_iso, job_id)
+            )
+            return
+        if send_result.get('status') == 'unconfirmed':
+            # bot sudah menerima request tapi jawabannya tidak sempat dibaca: jangan diulang (bisa terkirim dua kali)
+            con.execute(
+                "UPDATE outbox SET status='unconfirmed', attempts=attempts+1, last_error=?, updated_at=? WHERE id=?",
+                (send_result['error'], now_iso, job_id)
+            )
+            return
+        if send_result.get('status') == 'deferred':
+            # circuit terbuka / antrian bot penuh: bukan percobaan gagal, tunggu sampai gateway boleh dicoba lagi
+            con.execute(
+                "UPDATE outbox SET status='pending', next_attempt_at=?, last_error=?, updated_at=? WHERE id=?",
+                (send_result.get('retry_at') or time.time(), send_result['error'], now_iso, job_id)
+            )
+            return
+        row = con.execute("SELECT attempts FROM outbox WHERE id=?", (job_id,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        status = 'dead' if attempts >= OUTBOX_MAX_ATTEMPTS else 'pending'
+        next_at = time.time() + OUTBOX_BACKOFF_BASE_SEC * (2 ** (attempts - 1))
+        con.execute(
+            "UPDATE outbox SET status=?, attempts=?, next_attempt_at=?, last_error=?, updated_at=? WHERE id=?",
+            (status, attempts, next_at, str(send_result.get('error', send_result.get('status'))), now_iso, job_id)
+        )
+
+def claim_outbox_jobs(limit):
+    """Ambil job pending yang sudah jatuh tempo dan tandai 'sending' (atomic per job)."""
+    now = time.time()
+    now_iso = datetime.utcnow().isoformat()
+    claimed = []
+    with get_db_connection() as con:
+        rows = con.execute(
+            "SELECT * FROM outbox WHERE status='pending' AND next_attempt_at<=? ORDER BY next_attempt_at LIMIT ?",
+            (now, limit)
+        ).fetchall()
+        for row in rows:
+            cur = con.execute(
+                "UPDATE outbox SET status='sending', updated_at=? WHERE id=? AND status='pending'",
+                (now_iso, row['id'])
+            )
+            if cur.rowcount:
+                claimed.append(dict(row))
+    return claimed
+
+def requeue_stale_outbox_jobs():
+    """Job yang tertinggal di 'sending' (mis. proses mati di tengah kirim) dikembalikan ke pending."""
+    cutoff = (datetime.utcnow() - timedelta(seconds=OUTBOX_STALE_SEC)).isoformat()
+    with get_db_connection() as con:
+        return con.execute(
+            "UPDATE outbox SET status='pending', next_attempt_at=? WHERE status='sending' AND updated_at<?",
+            (time.time(), cutoff)
+        ).rowcount
+
+def touch_outbox_jobs(job_ids):
+    """Perbarui updated_at job 'sending' (tanda masih dikerjakan, bukan ditinggal proses yang mati)."""
+    now_iso = datetime.utcnow().isoformat()
+    with get_db_connection() as con:
+        for i in range(0, len(job_ids), 500):
+            part = job_ids[i:i + 500]
+            con.execute(f"UPDATE outbox SET updated_at=? WHERE status='sending' AND id IN ({','.join('?' * len(part))})",
+                        [now_iso] + part)
+
+def dispatch_outbox_jobs(job_ids, jobs, on_result=None):
+    """
+    dispatch_messages untuk job outbox yang sudah di-claim, per chunk. Job yang belum selesai di-touch
+    tiap OUTBOX_STALE_SEC/3 dan hasil dicatat begitu chunk selesai, jadi run panjang tidak dianggap macet
+    oleh requeue_stale_outbox_jobs (lalu dikirim ulang oleh worker lain).
+    """
+    chunk_size = max(1, GATEWAY_BATCH_SIZE if GATEWAY_BATCH_SIZE > 1 else OUTBOX_BATCH_SIZE)
+    results = []
+    last_touch = None
+    for start in range(0, len(jobs), chunk_size):
+        if last_touch is None or time.monotonic() - last_touch >= OUTBOX_STALE_SEC / 3:
+            touch_outbox_jobs(job_ids[start:])
+            last_touch = time.monotonic()
+        cb = (lambda i, res, offset=start: on_result(offset + i, res)) if on_result else None
+        chunk_results = dispatch_messages(jobs[start:start + chunk_size], on_result=cb)
+        for job_id, send_result in zip(job_ids[start:start + chunk_size], chunk_results):
+            complete_outbox_job(job_id, send_result)
+        results.extend(chunk_results)
+    return results
+
+def process_outbox_batch(limit=None):
+    jobs = claim_outbox_jobs(OUTBOX_BATCH_SIZE if limit is None else limit)
+    if not jobs:
+        return 0
+    run_id = f"outbox-{jobs[0]['id']}"
+    results = dispatch_outbox_jobs([j['id'] for j in jobs], [(j['phone'], message_ref(j)) for j in jobs],
+                                   on_result=send_progress_publisher(run_id, [j['reminder_id'] for j in jobs]))
+    publish_event("send.finished", run=run_id, total=len(jobs), sent=sum(1 for r in results if _is_sent(r)),
+                  deferred=sum(1 for r in results if r.get('status') == 'deferred'), skipped=0)
+    return len(jobs)
+
+class OutboxWorker(threading.Thread):
+    """Background thread yang menguras outbox; tidur OUTBOX_POLL_SEC atau sampai ada job baru."""
+
+    def __init__(self, poll_sec=None):
+        super().__init__(name="outbox-worker", daemon=True)
+        self.poll_sec = OUTBOX_POLL_SEC if poll_sec is None else poll_sec
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        requeue_stale_outbox_jobs()
+        while not self._stopping.is_set():
+            try:
+                if process_outbox_batch():
+                    continue  # masih ada kemungkinan job lain, langsung lanjut
+            except Exception as e:
+                log_event(logging.ERROR, "outbox worker error", error=e)
+            self._wake.wait(self.poll_sec)
+            self._wake.clear()
+
+_outbox_worker = None
+
+def start_outbox_worker():
+    global _outbox_worker
+    if _outbox_worker is None:
+        _outbox_worker = OutboxWorker()
+        _outbox_worker.start()
+    return _outbox_worker
+
+def stop_outbox_worker():
+    global _outbox_worker
+    if _outbox_worker is not None:
+        _outbox_worker.stop()
+        _outbox_worker = None
+
+def stage_label(offset):
+    return "H" if offset == 0 else f"H-{offset}"
+
+def outbox_depth():
+    with get_db_connection() as con:
+        return con.execute("SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+OUTBOX_DEPTH = GaugeMetric("outbox_depth", "Jumlah job outbox yang belum terkirim (pending + sending)", func=outbox_depth)
+
+def due_reminders(today):
+    """Mode 'all': list (record, days_until, stage) untuk semua reminder yang belum lewat."""
+    due = []
+    for r in list_reminders():
         test_date = datetime.strptime(r['test_date'], '%Y-%m-%d').date()
         days_until = (test_date - today).days
-        status_label, color = classify_by_days(days_until)
         if days_until >= 0:
-            msg = build_message(r, status_label)
-            phone = normalize_phone(r.get('phone') or "")
-            send_result = send_whatsapp_message(phone, msg)
-            actions.append({
-                'id': r['id'],
-                'name': r['name'],
-                'vehicle_number': r['vehicle_number'],
-                'test_date': r['test_date'],
-                'days_until': days_until,
-                'status': status_label,
-                'color': color,
-                'send_result': send_result
-            })
-            print(f"[{status_label}] Reminder sent to {r['name']} ({r['vehicle_number']}) → {send_result.get('status')}")
+            due.append((r, days_until, classify_by_days(days_until)[0]))
+    return due
+
+def due_window_reminders(today, stages=None):
+    """
+    Mode 'window': hanya reminder yang test_date-nya tepat today + offset salah satu stage,
+    dan belum pernah di-enqueue untuk stage tsb. Seleksi dikerjakan SQLite lewat idx_reminders_test_date.
+    Return list (record, days_until, stage).
+    """
+    stages = REMINDER_STAGES if stages is None else stages
+    if not stages:
+        return []
+    params = []
+    for offset in stages:
+        params += [offset, stage_label(offset), (today + timedelta(days=offset)).isoformat()]
+    values = ", ".join(["(?, ?, ?)"] * len(stages))
+    with get_db_connection() as con:
+        rows = con.execute(f"""
+            WITH stages(days_until, stage, due_date) AS (VALUES {values})
+            SELECT r.*, stages.days_until AS _days_until, stages.stage AS _stage
+            FROM stages JOIN reminders r ON r.test_date = stages.due_date
+            WHERE NOT EXISTS (
+                SELECT 1 FROM outbox o
+                WHERE o.idempotency_key = r.id || ':' || r.test_date || ':' || stages.stage
+            )
+            ORDER BY r.test_date, r.id
+        """, params).fetchall()
+    due = []
+    for row in rows:
+        r = dict(row)
+        days_until = r.pop('_days_until')
+        stage = r.pop('_stage')
+        due.append((r, days_until, stage))
+    return due
+
+def select_due(today, mode=None):
+    mode = RUN_MODE if mode is None else mode
+    if mode == 'all':
+        return due_reminders(today)
+    return due_window_reminders(today)
+
+def run_now_check(as_of_date=None, mode=None):
+    started = time.perf_counter()
+    today = date.today() if as_of_date is None else datetime.strptime(as_of_date, '%Y-%m-%d').date()
+    due = select_due(today, mode)
+
+    # enqueue dulu (idempotent), lalu kirim langsung hanya job yang baru dibuat
+    job_ids = []
+    jobs = []
+    claimed_ids = []
+    job_reminders = []
+    for r, days_until, stage in due:
+        status_label, color = classify_by_days(days_until)
+        phone = normalize_phone(r.get('phone') or "")
+        msg = build_message(r, status_label)
+        job_id, created = enqueue_message(r['id'], r['test_date'], stage, phone, msg, claim=True)
+        job_ids.append((job_id, created))
+        if created:
+            jobs.append((phone, msg))
+            claimed_ids.append(job_id)
+            job_reminders.append(r['id'])
+    run_id = f"run-{int(time.time() * 1000)}"
+    progress = send_progress_publisher(run_id, job_reminders)
+    sent_iter = iter(dispatch_outbox_jobs(claimed_ids, jobs, on_result=progress))
+
+    actions = []
+    for (r, days_until, stage), (job_id, created) in zip(due, job_ids):
+        status_label, color = classify_by_days(days_until)
+        if created:
+            send_result = next(sent_iter)
+        else:
+            send_result = {"status": "skipped", "reason": "duplicate", "job_id": job_id}
+        actions.append({
+            'id': r['id'],
+            'name': r['name'],
+            'vehicle_number': r['vehicle_number'],
+            'test_date': r['test_date'],
+            'days_until': days_until,
+            'status': status_label,
+            'color': color,
+            'send_result': send_result
+        })
+        log_event(logging.DEBUG, "reminder processed", id=r['id'], vehicle=r['vehicle_number'],
+                  stage=stage, result=send_result.get('status'))
+    elapsed = time.perf_counter() - started
+    LAST_RUN_DURATION.set(round(elapsed, 3))
+    LAST_RUN_MESSAGES.set(len(actions))
+    LAST_RUN_TIMESTAMP.set(round(time.time(), 3))
+    sent = sum(1 for a in actions if _is_sent(a['send_result']))
+    deferred = sum(1 for a in actions if a['send_result'].get('status') == 'deferred')
+    publish_event("send.finished", run=run_id, total=len(jobs), sent=sent, deferred=deferred,
+                  skipped=len(actions) - len(jobs), seconds=round(elapsed, 3))
+    log_event(logging.INFO, "run selesai", due=len(actions), sent=sent, deferred=deferred, seconds=round(elapsed, 3))
     return actions
 
+def enqueue_due_reminders(as_of_date=None, mode=None):
+    """Versi async dari run_now_check: hanya enqueue, pengiriman dikerjakan OutboxWorker."""
+    today = date.today() if as_of_date is None else datetime.strptime(as_of_date, '%Y-%m-%d').date()
+    queued = []
+    for r, days_until, stage in select_due(today, mode):
+        status_label, _ = classify_by_days(days_until)
+        job_id, created = enqueue_message(
+            r['id'], r['test_date'], stage,
+            normalize_phone(r.get('phone') or ""), build_message(r, status_label)
+        )
+        queued.append({'id': r['id'], 'job_id': job_id, 'duplicate': not created, 'stage': stage, 'status': status_label})
+    return queued
+
+# ----------------- SCHEDULER -----------------
+class ReminderScheduler(threading.Thread):
+    """
+    Scheduler in-process berbasis heap: satu entry per reminder berisi waktu notifikasi berikutnya
+    (test_date - offset stage, jam SCHEDULER_SEND_HOUR). Thread tidur sampai entry paling awal
+    lalu meng-enqueue ke outbox, jadi pengiriman tetap idempoten dan mengikuti rate limit worker.
+    Hanya reminder dengan test_date dalam horizon stage yang dimuat; horizon di-refill tiap tengah malam.
+    """
+
+    def __init__(self, stages=None, send_hour=None, horizon_days=None):
+        super().__init__(name="reminder-scheduler", daemon=True)
+        self.stages = sorted(REMINDER_STAGES if stages is None else stages, reverse=True)
+        self.send_hour = SCHEDULER_SEND_HOUR if send_hour is None else send_hour
+        self.horizon_days = SCHEDULER_HORIZON_DAYS if horizon_days is None else horizon_days
+        self.heap = []          # (fire_at, seq, reminder_id, version, stage, test_date)
+        self.versions = {}      # reminder_id -> versi terbaru; entry dengan versi lama diabaikan saat di-pop
+        self.seq = itertools.count()
+        self.window_end = None  # test_date terjauh yang sudah dimuat ke heap
+        self._cond = threading.Condition()
+        self._stopping = False
+
+    def fire_time(self, test_date, offset):
+        d = test_date - timedelta(days=offset)
+        return datetime(d.year, d.month, d.day, self.send_hour).timestamp()
+
+    def next_event(self, test_date, now, catch_up=True):
+        """
+        (fire_at, stage) berikutnya untuk satu reminder, None kalau sudah tidak ada.
+        catch_up=True (hanya saat start, setelah downtime): stage terakhir yang terlewat dikirim segera,
+        kecuali stage berikutnya masih jatuh di hari yang sama; stage yang lebih lama dilewati.
+        Jadi pemilik tidak menerima beberapa reminder sekaligus atau dalam hari yang sama.
+        """
+        if test_date < date.fromtimestamp(now):
+            return None
+        missed = None
+        for offset in self.stages:  # urut dari offset terbesar = waktu paling awal
+            fire_at = self.fire_time(test_date, offset)
+            if fire_at > now:
+                if missed and date.fromtimestamp(fire_at) == date.fromtimestamp(now):
+                    missed = None  # stage berikut dikirim hari ini juga, yang terlewat tidak perlu
+                return missed or (fire_at, stage_label(offset))
+            if catch_up:
+                missed = (now, stage_label(offset))
+        return missed
+
+    def _push(self, reminder_id, test_date, event):
+        fire_at, stage = event
+        heapq.heappush(self.heap, (fire_at, next(self.seq), reminder_id,
+                                   self.versions.get(reminder_id, 0), stage, test_date))
+
+    def _parse(self, test_date):
+        try:
+            return datetime.strptime(str(test_date)[:10], '%Y-%m-%d').date()
+        except ValueError:
+            return None
+
+    def load_window(self, catch_up=False):
+        """
+        Bangun ulang heap dari reminder yang test_date-nya masuk horizon (pakai idx_reminders_test_date).
+        catch_up=True hanya untuk load pertama saat start; refill/import cukup menjadwalkan stage berikutnya.
+        """
+        today = date.today()
+        window_end = today + timedelta(days=max(self.stages, default=0) + self.horizon_days)
+        # baca & bangun ulang di bawah lock yang sama: upsert yang datang setelah SELECT menunggu,
+        # lalu menimpa entry hasil load (versi naik) dan tidak ikut terhapus oleh reset heap.
+        with self._cond:
+            with get_db_connection() as con:
+                rows = con.execute(
+                    "SELECT id, test_date FROM reminders WHERE test_date BETWEEN ? AND ?",
+                    (today.isoformat(), window_end.isoformat())
+                ).fetchall()
+            now = time.time()
+            self.heap, self.versions, self.window_end = [], {}, window_end
+            for row in rows:
+                td = self._parse(row['test_date'])
+                event = td and self.next_event(td, now, catch_up=catch_up)
+                if event:
+                    self._push(row['id'], td, event)
+            tomorrow = today + timedelta(days=1)
+            # entry khusus (reminder_id None) untuk menggeser horizon besok
+            heapq.heappush(self.heap, (datetime(tomorrow.year, tomorrow.month, tomorrow.day).timestamp(),
+                                       next(self.seq), None, 0, "refill", None))
+            self._cond.notify()
+        log_event(logging.INFO, "scheduler window loaded", reminders=len(rows), until=window_end.isoformat())
+
+    def upsert(self, reminder_id, test_date):
+        td = self._parse(test_date)
+        with self._cond:
+            self.versions[reminder_id] = self.versions.get(reminder_id, 0) + 1
+            if td is None or self.window_end is None or td > self.window_end:
+                return  # di luar horizon: akan termuat saat refill
+            event = self.next_event(td, time.time(), catch_up=False)
+            if event:
+                self._push(reminder_id, td, event)
+                self._cond.notify()
+
+    def remove(self, reminder_id):
+        with self._cond:
+            self.versions[reminder_id] = self.versions.get(reminder_id, 0) + 1
+
+    def clear(self):
+        with self._cond:
+            self.heap = [e for e in self.heap if e[2] is None]
+            heapq.heapify(self.heap)
+            self.versions = {}
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+
+    def status(self):
+        with self._cond:
+            pending = [e for e in self.heap if e[2] is not None and self.versions.get(e[2], 0) == e[3]]
+            nxt = min(pending, default=None)
+        return {
+            "running": self.is_alive(),
+            "queued": len(pending),
+            "window_end": self.window_end.isoformat() if self.window_end else None,
+            "next": {"reminder_id": nxt[2], "stage": nxt[4],
+                     "at": datetime.fromtimestamp(nxt[0]).isoformat(timespec='seconds')} if nxt else None,
+        }
+
+    def _take_due(self):
+        """Tunggu sampai entry paling awal jatuh tempo, lalu ambil semua entry yang sudah due."""
+        with self._cond:
+            while not self._stopping:
+                wait = self.heap[0][0] - time.time() if self.heap else None
+                if wait is not None and wait <= 0:
+                    break
+                self._cond.wait(wait)
+            if self._stopping:
+                return None
+            due, now = [], time.time()
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                if entry[2] is None or self.versions.get(entry[2], 0) == entry[3]:
+                    due.append(entry)
+            return due
+
+    def fire(self, entries):
+        ids = [e[2] for e in entries]
+        records = {}
+        with get_db_connection() as con:
+            for i in range(0, len(ids), 500):
+                part = ids[i:i + 500]
+                rows = con.execute(
+                    f"SELECT * FROM reminders WHERE id IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                records.update((r['id'], dict(r)) for r in rows)
+        today, queued = date.today(), 0
+        for fire_at, _, reminder_id, version, stage, td in entries:
+            r = records.get(reminder_id)
+            if r is None or self._parse(r['test_date']) != td:
+                continue  # sudah dihapus/diubah; perubahan masuk lewat upsert()
+            status_label, _ = classify_by_days((td - today).days)
+            _, created = enqueue_message(
+                reminder_id, r['test_date'], stage,
+                normalize_phone(r.get('phone') or ""), build_message(r, status_label)
+            )
+            queued += created
+            with self._cond:
+                if self.versions.get(reminder_id, 0) == version:
+                    event = self.next_event(td, max(time.time(), fire_at), catch_up=False)
+                    if event:
+                        self._push(reminder_id, td, event)
+        if entries:
+            log_event(logging.INFO, "scheduler fired", due=len(entries), queued=queued)
+
+    def run(self):
+        try:
+            self.load_window(catch_up=True)
+        except Exception as e:
+            log_event(logging.ERROR, "scheduler load failed", error=e)
+        while True:
+            due = self._take_due()
+            if due is None:
+                break
+            try:
+                self.fire([e for e in due if e[2] is not None])
+                if any(e[2] is None for e in due):
+                    self.load_window()
+            except Exception as e:
+                log_event(logging.ERROR, "scheduler error", error=e)
+
+_scheduler = None
+
+def start_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReminderScheduler()
+        _scheduler.start()
+    return _scheduler
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is not None:
+        _scheduler.stop()
+        _scheduler = None
+
+def schedule_reminder(reminder_id, test_date):
+    if _scheduler is not None:
+        _scheduler.upsert(reminder_id, test_date)
+
+def unschedule_reminder(reminder_id):
+    if _scheduler is not None:
+        _scheduler.remove(reminder_id)
+
 # ----------------- ROUTES -----------------
 
 @app.route("/", methods=["GET"])
@@ -204,12 +2678,24 @@ def api_home():
             "message": "WhatsApp Reminder API is running!",
             "available_endpoints": {
                 "POST /add": "Add new reminder",
-                "GET /list": "Get list of reminders",
-                "POST /run_now": "Run reminders manually",
+                "GET /list": "Get list of reminders (format=json; page, per_page, cursor, sort, order, status, q untuk server-side)",
+                "GET /list/summary": "Jumlah reminder per status",
+                "GET /search": "Cari reminder (q: plat/no uji/nama/HP, ranking + page/per_page/status)",
+                "POST /import": "Bulk import CSV/XLSX (multipart field 'file'), upsert by no_uji",
+                "GET /export.csv": "Streaming export CSV (status, q opsional)",
+                "GET /reminder/<id>": "Get one reminder",
+                "POST /run_now": "Run reminders manually ({\"queue\": true} = enqueue ke outbox)",
+                "GET /outbox": "Outbox summary per status",
+                "GET /outbox/<id>": "Outbox job status",
+                "GET /messages": "Log pesan (direction, phone, limit, before_id), teks dirender dari template",
+                "POST /webhook/inbound": "Batch pesan masuk dari WA bot ({messages: [...]})",
+                "GET /events": "Server-Sent Events (counter, reminder.*, send.*)",
+                "GET /scheduler": "Status scheduler otomatis (entry berikutnya)",
                 "DELETE /clear": "Clear all reminders and reset IDs",
                 "POST /upload-avatar": "Upload user avatar",
                 "GET /api/stats": "Stats (in/out/users)",
-                "GET /api/messages_timeseries": "messages timeseries (period=day|month)"
+                "GET /api/messages_timeseries": "messages timeseries (period=day|month)",
+                "GET /metrics": "Prometheus metrics"
             }
         })
     return render_template("api.html")
@@ -228,20 +2714,26 @@ def http_add():
     phone = data.get('phone') or ""
     no_uji = data.get('no_uji')
     jenis_kendaraan = data.get('jenis_kendaraan')
-    add_reminder(data['name'], None, data['vehicle_number'], data['test_date'], {
-        'phone': phone,
-        'no_uji': no_uji,
-        'jenis_kendaraan': jenis_kendaraan
-    })
+    try:
+        add_reminder(data['name'], data.get('nik'), data['vehicle_number'], data['test_date'], {
+            'phone': phone,
+            'no_uji': no_uji,
+            'jenis_kendaraan': jenis_kendaraan
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
     return jsonify({'status': 'ok'})
 
 @app.route("/delete/<int:reminder_id>", methods=["DELETE"])
 def delete_reminder(reminder_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM reminders WHERE id=?", (reminder_id,))
-    conn.commit()
-    conn.close()
+    with get_db_connection() as con:
+        deleted = con.execute("DELETE FROM reminders WHERE id=?", (reminder_id,)).rowcount
+    if not deleted:
+        # jangan publish delete untuk id yang tidak ada: dashboard akan mengurangi counter yang salah
+        return jsonify({"error": "Reminder tidak ditemukan"}), 404
+    bump_data_version()
+    unschedule_reminder(reminder_id)
+    publish_event("reminder.deleted", id=reminder_id)
     return jsonify({"status": "deleted", "id": reminder_id})
 
 @app.route("/send_one/<int:reminder_id>", methods=["POST"])
@@ -252,85 +2744,293 @@ def send_one(reminder_id):
             return jsonify({"error": "Reminder tidak ditemukan"}), 404
 
         reminder = dict(row)
-        message = build_message(reminder, "manual")
-        phone = normalize_phone(reminder.get('phone') or "")
-        send_result = send_whatsapp_message(phone, message)
+    message = build_message(reminder, "manual")
+    phone = normalize_phone(reminder.get('phone') or "")
+    # satu kirim manual per hari per reminder; yang sudah 'dead' boleh dicoba lagi
+    stage = f"manual-{date.today().isoformat()}"
+    queue = request.args.get("queue") == "1"
+    job_id, created = enqueue_message(reminder_id, reminder['test_date'], stage, phone, message,
+                                      claim=not queue, reopen_dead=True)
+    if not created:
+        job = get_outbox_job(job_id)
+        return jsonify({"id": reminder_id, "job_id": job_id, "status": "duplicate",
+                        "job_status": job['status'] if job else None, "last_error": job['last_error'] if job else None}), 202
+    if queue:
+        return jsonify({"id": reminder_id, "job_id": job_id, "status": "queued"}), 202
 
-        return jsonify({
-            "id": reminder_id,
-            "status": send_result.get('status'),
-            "detail": send_result
-        })
+    send_result = send_whatsapp_message(phone, message)
+    complete_outbox_job(job_id, send_result)
+    return jsonify({
+        "id": reminder_id,
+        "job_id": job_id,
+        "status": send_result.get('status'),
+        "detail": send_result
+    })
 
 @app.route('/clear', methods=['DELETE'])
 def clear_reminders():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Hapus semua data
-    c.execute("DELETE FROM reminders")
-    # Reset autoincrement (SQLite pakai sqlite_sequence)
-    c.execute("DELETE FROM sqlite_sequence WHERE name='reminders'")
-    conn.commit()
-    conn.close()
+    with get_db_connection() as con:
+        # Hapus semua data
+        con.execute("DELETE FROM reminders")
+        # Reset autoincrement (SQLite pakai sqlite_sequence)
+        con.execute("DELETE FROM sqlite_sequence WHERE name='reminders'")
+    bump_data_version()
+    if _scheduler is not None:
+        _scheduler.clear()
+    publish_event("reminders.cleared")
     return jsonify({"message": "Semua data terhapus dan ID direset ke 1"})
 
 @app.route('/list', methods=['GET'])
+@cached_response
 def list_reminders_route():
-    reminders = list_reminders()
-    if request.args.get("format") == "json":
-        return jsonify(reminders)
-    return render_template("db.html", reminders=reminders)
+    if request.args.get("format") != "json":
+        return render_template("db.html")
+    # mode server-side aktif kalau ada salah satu parameter paging/filter
+    paged_args = ('page', 'per_page', 'cursor', 'sort', 'order', 'status', 'q')
+    if not any(k in request.args for k in paged_args):
+        return jsonify(list_reminders())
+    try:
+        result = query_reminders(
+            page=request.args.get('page', 1),
+            per_page=request.args.get('per_page', 25),
+            sort=request.args.get('sort', 'test_date'),
+            order=request.args.get('order', 'asc'),
+            status=request.args.get('status'),
+            q=request.args.get('q'),
+            cursor=request.args.get('cursor'),
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
+@app.route('/search', methods=['GET'])
+@cached_response
+def search_route():
+    q = request.args.get('q', '')
+    try:
+        result = search_reminders(
+            q,
+            page=request.args.get('page', 1),
+            per_page=request.args.get('per_page', 25),
+            status=request.args.get('status'),
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+    result['q'] = q
+    return jsonify(result)
+
+@app.route('/import', methods=['POST'])
+def http_import():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    try:
+        report = import_reminders(file.stream, file.filename, dry_run=request.args.get('dry_run') == '1')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(report)
+
+@app.route('/export.csv', methods=['GET'])
+def http_export_csv():
+    status = request.args.get('status')
+    try:
+        if status and status != 'Semua Data':
+            status_filter_sql(status, date.today())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filename = f"reminders_{date.today().isoformat()}.csv"
+    return Response(
+        stream_with_context(iter_export_csv(status=status, q=request.args.get('q'))),
+        mimetype='text/csv',
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.route('/list/summary', methods=['GET'])
+@cached_response
+def list_summary():
+    return jsonify(reminder_status_counts())
+
+@app.route('/reminder/<int:reminder_id>', methods=['GET'])
+@cached_response
+def reminder_detail(reminder_id):
+    reminder = get_reminder(reminder_id)
+    if not reminder:
+        return jsonify({"error": "Reminder tidak ditemukan"}), 404
+    return jsonify(reminder)
 
 @app.route("/edit/<int:reminder_id>", methods=["PUT"])
 def edit_reminder(reminder_id):
     data = request.get_json(force=True)
+    try:
+        test_date = datetime.strptime(str(data.get("test_date")).split()[0], '%Y-%m-%d').strftime('%Y-%m-%d')
+    except Exception:
+        return jsonify({'error': 'test_date must be YYYY-MM-DD'}), 400
     try:
         with get_db_connection() as con:
-            con.execute("""
+            updated = con.execute("""
                 UPDATE reminders 
                 SET name=?, vehicle_number=?, no_uji=?, jenis_kendaraan=?, test_date=?, phone=? 
                 WHERE id=?
             """, (
                 data.get("name"),
                 data.get("vehicle_number"),
-                data.get("no_uji"),
+                data.get("no_uji") or None,
                 data.get("jenis_kendaraan"),
-                data.get("test_date"),
+                test_date,
                 data.get("phone"),
                 reminder_id
-            ))
+            )).rowcount
+        if not updated:
+            return jsonify({"error": "Reminder tidak ditemukan"}), 404
+        bump_data_version()
+        schedule_reminder(reminder_id, test_date)
+        publish_event("reminder.updated", id=reminder_id, test_date=test_date)
         return jsonify({"status": "updated", "id": reminder_id})
+    except sqlite3.IntegrityError:
+        return jsonify({"error": f"no_uji {data.get('no_uji')} sudah terdaftar"}), 409
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 @app.route('/run_now', methods=['POST'])
 def http_run_now():
     data = request.get_json(silent=True) or {}
-    actions = run_now_check(as_of_date=data.get('as_of'))
+    if data.get('queue'):
+        queued = enqueue_due_reminders(as_of_date=data.get('as_of'), mode=data.get('mode'))
+        return jsonify({"queued": sum(1 for q in queued if not q['duplicate']), "jobs": queued}), 202
+    # multi-worker: satu run sinkron sekaligus di semua proses (outbox tetap mencegah kirim ganda per job)
+    try:
+        with Lease("run_now"):
+            actions = run_now_check(as_of_date=data.get('as_of'), mode=data.get('mode'))
+    except LeaseUnavailable:
+        return jsonify({"error": "Run lain sedang berjalan", "holder": lease_holder("run_now")}), 409
     return jsonify(actions)
 
+@app.route('/outbox/<int:job_id>', methods=['GET'])
+def outbox_job(job_id):
+    job = get_outbox_job(job_id)
+    if not job:
+        return jsonify({"error": "Job tidak ditemukan"}), 404
+    return jsonify(job)
+
+@app.route('/outbox', methods=['GET'])
+def outbox_summary():
+    with get_db_connection() as con:
+        rows = con.execute("SELECT status, COUNT(*) AS cnt FROM outbox GROUP BY status").fetchall()
+    return jsonify({r['status']: r['cnt'] for r in rows})
+
+@app.route('/messages', methods=['GET'])
+@cached_response
+def list_messages():
+    """Log pesan terbaru (teks lengkap dirender ulang); filter direction, phone; paging lewat before_id."""
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), LIST_MAX_PER_PAGE))
+        before_id = int(request.args['before_id']) if request.args.get('before_id') else None
+    except ValueError:
+        return jsonify({'error': 'limit/before_id harus angka'}), 400
+    where, params = [], []
+    if request.args.get('direction') in ('in', 'out'):
+        where.append("direction = ?")
+        params.append(request.args['direction'])
+    if request.args.get('phone'):
+        where.append("phone = ?")
+        params.append(normalize_phone(request.args['phone']))
+    if before_id is not None:
+        where.append("id < ?")
+        params.append(before_id)
+    sql = "SELECT * FROM messages" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id DESC LIMIT ?"
+    with get_db_connection() as con:
+        rows = con.execute(sql, params + [limit]).fetchall()
+    data = [{
+        'id': r['id'],
+        'direction': r['direction'],
+        'phone': r['phone'],
+        'message': message_text(r),
+        'status': r['status'],
+        'meta': r['meta'],
+        'template': f"{r['template_id']}@{r['template_version']}" if r['template_id'] else None,
+        'reminder_id': r['reminder_id'],
+        'created_at': r['created_at'],
+    } for r in rows]
+    return jsonify({'data': data, 'next_before_id': data[-1]['id'] if len(data) == limit else None})
+
+@app.route('/webhook/inbound', methods=['POST'])
+def inbound_webhook():
+    if WEBHOOK_TOKEN and request.headers.get("X-Webhook-Token") != WEBHOOK_TOKEN:
+        return jsonify({"error": "unauthorized"}), 401
+    data = request.get_json(silent=True)
+    items = data.get("messages") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return jsonify({"error": "Body harus {messages: [...]}"}), 400
+    report = ingest_inbound_messages([i for i in items if isinstance(i, dict)])
+    log_event(logging.INFO, "inbound batch", **report)
+    return jsonify(report)
+
+@app.route('/events', methods=['GET'])
+def events_stream():
+    """Server-Sent Events: delta counter, perubahan reminder & progress kirim (lihat publish_event)."""
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_id')
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        last_id = None
+    sub = event_broadcaster.subscribe(last_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    seq, event, payload = sub.get(timeout=EVENTS_KEEPALIVE_SEC)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {seq}\nevent: {event}\ndata: {payload}\n\n"
+        finally:
+            event_broadcaster.unsubscribe(sub)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/scheduler', methods=['GET'])
+def scheduler_status():
+    # scheduler hanya jalan di worker pemegang lease 'dispatch'; worker lain menunjuk ke sana
+    if _scheduler is None:
+        return jsonify({"running": False, "leader": lease_holder("dispatch")})
+    return jsonify({**_scheduler.status(), "leader": lease_holder("dispatch")})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 @app.route('/dashboard', methods=['GET'])
 def dashboard():
     return render_template('dashboard.html')
 
 # ----------------- STAT endpoints -----------------
 @app.route('/api/stats', methods=['GET'])
+@cached_response
 def api_stats():
     # in = pesan masuk hari ini, out = pesan keluar hari ini, users = jumlah rows reminders
     today = datetime.utcnow().date().isoformat()
     with get_db_connection() as con:
-        in_count = con.execute("SELECT COUNT(*) FROM messages WHERE direction='in' AND date(created_at)=?", (today,)).fetchone()[0]
-        out_count = con.execute("SELECT COUNT(*) FROM messages WHERE direction='out' AND date(created_at)=?", (today,)).fetchone()[0]
+        rows = con.execute(
+            "SELECT direction, SUM(cnt) AS cnt FROM message_counts_daily WHERE day=? GROUP BY direction", (today,)
+        ).fetchall()
         users = con.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
-    return jsonify({"in": in_count, "out": out_count, "users": users})
+    counts = {r['direction']: r['cnt'] for r in rows}
+    return jsonify({"in": counts.get('in', 0), "out": counts.get('out', 0), "users": users})
 
 @app.route('/api/user_count', methods=['GET'])
+@cached_response
 def api_user_count():
     with get_db_connection() as con:
         users = con.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
     return jsonify({"users": users})
 
 @app.route('/api/messages_timeseries', methods=['GET'])
+@cached_response
 def api_messages_timeseries():
     """
     Query params:
@@ -342,24 +3042,16 @@ def api_messages_timeseries():
     """
     period = request.args.get('period', 'day')
     if period == 'month':
-        months = int(request.args.get('months', 12))
-        with get_db_connection() as con:
-            # last N months including this one
-            rows = con.execute("""
-                SELECT strftime('%Y-%m', created_at) as period, COUNT(*) as cnt
-                FROM messages
-                WHERE direction='out' AND date(created_at) >= date('now','start of month', ?)
-                GROUP BY period
-                ORDER BY period
-            """, (f"-{months-1} months",)).fetchall()
+        try:
+            months = int(request.args.get('months', 12))
+        except ValueError:
+            return jsonify({"error": "months harus bilangan bulat"}), 400
+        if months <= 0:
+            return jsonify({"labels": [], "data": []})
         labels = []
         data = []
         # build ordered list of last months
-        from datetime import datetime
         now = datetime.utcnow()
-        months_list = []
-        for i in range(months-1, -1, -1):
-            m = (now.replace(day=1) - __import__('datetime').timedelta(days=0)).month  # dummy to satisfy style
         # simpler build using relativedelta isn't available; use loop:
         months_list = []
         for i in range(months-1, -1, -1):
@@ -371,6 +3063,15 @@ def api_messages_timeseries():
                 m += 12
                 y -= 1
             months_list.append(f"{y:04d}-{m:02d}")
+        with get_db_connection() as con:
+            # last N months including this one, dari rollup bulanan
+            rows = con.execute("""
+                SELECT month as period, SUM(cnt) as cnt
+                FROM message_counts_monthly
+                WHERE direction='out' AND month >= ?
+                GROUP BY period
+                ORDER BY period
+            """, (months_list[0],)).fetchall()
         rowdict = {r['period']: r['cnt'] for r in rows}
         for m in months_list:
             labels.append(m)
@@ -378,21 +3079,25 @@ def api_messages_timeseries():
         return jsonify({"labels": labels, "data": data})
 
     else:
-        days = int(request.args.get('days', 30))
-        with get_db_connection() as con:
-            rows = con.execute("""
-                SELECT date(created_at) as day, COUNT(*) as cnt
-                FROM messages
-                WHERE direction='out' AND date(created_at) >= date('now', ?)
-                GROUP BY day
-                ORDER BY day
-            """, (f"-{days-1} days",)).fetchall()
+        try:
+            days = int(request.args.get('days', 30))
+        except ValueError:
+            return jsonify({"error": "days harus bilangan bulat"}), 400
+        if days <= 0:
+            return jsonify({"labels": [], "data": []})
         labels = []
         data = []
         # build list of last days (YYYY-MM-DD)
-        from datetime import timedelta, datetime
         today = datetime.utcnow().date()
         days_list = [(today - timedelta(days=i)).isoformat() for i in range(days-1, -1, -1)]
+        with get_db_connection() as con:
+            rows = con.execute("""
+                SELECT day, SUM(cnt) as cnt
+                FROM message_counts_daily
+                WHERE direction='out' AND day >= ?
+                GROUP BY day
+                ORDER BY day
+            """, (days_list[0],)).fetchall()
         rowdict = {r['day']: r['cnt'] for r in rows}
         for d in days_list:
             labels.append(d)
@@ -434,17 +3139,120 @@ def reset_auth():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
+# ----------------- APP FACTORY -----------------
+class DispatchLeader(threading.Thread):
+    """
+    Rebutan lease 'dispatch' antar proses: hanya pemegangnya yang menjalankan OutboxWorker dan scheduler,
+    jadi pengiriman otomatis tidak ganda walau server berjalan dengan banyak worker.
+    Pemegang yang mati/hang kehilangan lease setelah LEASE_TTL_SEC dan worker lain mengambil alih.
+    """
+
+    def __init__(self, outbox=None, scheduler=None):
+        super().__init__(name="dispatch-leader", daemon=True)
+        self.lease = Lease("dispatch")
+        self.outbox = OUTBOX_WORKER if outbox is None else outbox
+        self.scheduler = SCHEDULER_ENABLED if scheduler is None else scheduler
+        self.leading = False
+        self._stopping = threading.Event()
+
+    def _start_services(self):
+        if self.outbox:
+            start_outbox_worker()
+        if self.scheduler:
+            start_scheduler()
+        self.leading = True
+        log_event(logging.INFO, "lease dispatch diperoleh", owner=self.lease.owner)
+
+    def _stop_services(self):
+        stop_outbox_worker()
+        stop_scheduler()
+        self.leading = False
+        log_event(logging.WARNING, "lease dispatch dilepas", owner=self.lease.owner)
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                held = self.lease.acquire()
+            except sqlite3.Error as e:
+                log_event(logging.ERROR, "lease dispatch error", error=e)
+                held = False
+            if held and not self.leading:
+                self._start_services()
+            elif not held and self.leading:
+                self._stop_services()
+            self._stopping.wait(self.lease.ttl / 3)
+        if self.leading:
+            self._stop_services()
+        try:
+            self.lease.release()  # worker lain bisa langsung mengambil alih tanpa menunggu TTL
+        except sqlite3.Error:
+            pass
+        close_db_connection()
+
+_dispatch_leader = None
+_app_ready = False
+
+def create_app(multi_worker=None):
+    """
+    Siapkan app untuk dijalankan: migrasi skema, writer log, dan service background.
+    Dipanggil sekali per proses (dev server di bawah, atau wsgi.py per worker gunicorn).
+    multi_worker=True: event SSE lewat tabel event_relay dan cache ikut commit dari worker lain.
+    """
+    global MULTI_WORKER, _dispatch_leader, _app_ready
+    if _app_ready:
+        return app
+    if multi_worker is not None:
+        MULTI_WORKER = multi_worker
+    init_db()
+    if MESSAGE_LOG_BUFFERED:
+        start_message_writer()
+    if MULTI_WORKER:
+        start_event_relay()
+    if (OUTBOX_WORKER or SCHEDULER_ENABLED) and _dispatch_leader is None:
+        _dispatch_leader = DispatchLeader()
+        _dispatch_leader.start()
+        atexit.register(shutdown_app)
+    _app_ready = True
+    log_event(logging.INFO, "database initialized", path=DB_PATH, pid=os.getpid(), multi_worker=MULTI_WORKER)
+    return app
+
+def shutdown_app():
+    """Lepas lease dispatch & flush log (dipanggil atexit / hook worker_exit gunicorn)."""
+    global _dispatch_leader, _event_relay
+    if _dispatch_leader is not None:
+        _dispatch_leader.stop()
+        _dispatch_leader.join(timeout=5)
+        _dispatch_leader = None
+    if _event_relay is not None:
+        _event_relay.stop()
+        _event_relay.join(timeout=5)  # flush event yang masih tertampung
+        _event_relay = None
+    stop_message_writer()
+
 # ----------------- MAIN -----------------
 if __name__ == "__main__":
-    init_db()
-    print('Database initialized (reminders.db).')
+    # debug reloader menjalankan modul dua kali; service background cukup di proses yang melayani HTTP
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        create_app()
     print('Available endpoints:')
     print('  POST /add')
     print('  GET  /list')
+    print('  GET  /list/summary')
+    print('  GET  /search?q=')
+    print('  POST /import')
+    print('  GET  /export.csv')
+    print('  GET  /reminder/<id>')
     print('  POST /run_now')
+    print('  GET  /outbox')
+    print('  GET  /scheduler')
+    print('  GET  /events')
     print('  DELETE /clear')
     print('  POST /upload-avatar')
     print('  POST /reset-auth')
     print('  GET /api/stats')
     print('  GET /api/messages_timeseries?period=day|month')
+    print('  GET /metrics')
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,6 @@
+# wsgi.py
+# Entry point produksi (multi-worker):
+#   gunicorn -c gunicorn.conf.py wsgi:app
+from whatsapp_reminder_app import create_app
+
+app = create_app(multi_worker=True)